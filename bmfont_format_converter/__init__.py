@@ -0,0 +1,46 @@
+# BMFont format converter, as a package:
+#
+#   import bmfont_format_converter as bmfc
+#   bmfc.check_file_format("example.fnt")   # only bmfile gets imported for this
+#   bmfc.bmbundle.Bundle("fonts.fntb")      # other modules are imported on first use
+#
+# or from the command line, with the same arguments as main.py:
+#
+#   python3 -m bmfont_format_converter example.fnt b
+from .bmfile import (
+    FILE_TYPE_INVALID,
+    FILE_TYPE_TEXT,
+    FILE_TYPE_XML,
+    FILE_TYPE_BINARY3,
+    FILE_TYPE_JSON,
+    FILE_TYPE_JSON_COLUMNS,
+    check_file_format,
+    check_data_format,
+    convert_blocks,
+)
+
+
+# Modules that are only imported when they're first used, so importing the
+# package stays as cheap as importing bmfile.
+SUBMODULES = [
+    "bmasync",
+    "bmatlas",
+    "bmbundle",
+    "bmcheck",
+    "bmdelta",
+    "bmedit",
+    "bmindex",
+    "bmkerning",
+    "bmmerge",
+    "bmmetrics",
+    "bmpipeline",
+    "bmquads",
+    "main",
+]
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        import importlib
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
@@ -0,0 +1,66 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Measures how long a fresh Python process takes to import the package and
+# check the format of one file, minus the time an empty Python process takes.
+# That's the cost a tool pays for using this package just to sniff a file.
+#
+#   python3 benchmark_startup.py [fnt file] [runs]
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("python (nothing imported)", "pass"),
+    ("import package + check_file_format()", "import bmfont_format_converter as b; b.check_file_format({0!r})"),
+    ("import bmfile + check_file_format()", "from bmfont_format_converter import bmfile; bmfile.check_file_format({0!r})"),
+    ("import every module", "import bmfont_format_converter as b; [getattr(b, x) for x in b.SUBMODULES]"),
+]
+
+
+# Runs a snippet in a new process a number of times. Returns the times in ms.
+def time_runs(code, runs, env):
+    times = []
+    for i in range(runs):
+        t1 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd = PACKAGE_DIRECTORY, env = env, check = True)
+        times.append((time.perf_counter() - t1) * 1000)
+    return times
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    runs = int(args[1]) if len(args) >= 2 else 30
+    
+    temp_filepath = None
+    if len(args) >= 1:
+        filepath = os.path.abspath(args[0])
+    else:
+        file = tempfile.NamedTemporaryFile("w", suffix = ".fnt", delete = False)
+        file.write("info face=\"Example\" size=32\n")
+        file.close()
+        filepath = temp_filepath = file.name
+    
+    # Bytecode has to be cached for the numbers to mean anything, so the
+    # first run of each case (which writes it) isn't counted
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    
+    try:
+        baseline = None
+        for name, code in CASES:
+            code = code.format(filepath)
+            time_runs(code, 1, env)
+            median = statistics.median(time_runs(code, runs, env))
+            if baseline is None:
+                baseline = median
+                print("{0}: {1:.1f} ms".format(name, median))
+            else:
+                print("{0}: {1:.1f} ms ({2:+.1f} ms)".format(name, median, median - baseline))
+    finally:
+        if temp_filepath is not None:
+            os.remove(temp_filepath)
@@ -0,0 +1,288 @@
+import asyncio
+import concurrent.futures
+import io
+import os
+import threading
+import weakref
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 60.0
+
+# Fragments are handed to the event loop in batches of about this many
+# characters/bytes, so the loop wakes up once per batch instead of once per line.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# How many batches a job may have waiting for its consumer. Together with the
+# chunk size, this caps how much memory each job's output can take.
+DEFAULT_QUEUE_DEPTH = 4
+
+# Sources smaller than this (in bytes) count as small, and this many of the
+# concurrency slots are kept free for them, so a few large conversions can
+# never make a small one wait.
+DEFAULT_SMALL_SIZE = 256 * 1024
+DEFAULT_SMALL_SLOTS = 2
+
+
+##########
+# Utility functions
+##########
+
+# Opens a source for reading. The source may be a filepath, or the raw bytes of
+# a file (e.g. an upload). Returns the opened file and its format.
+def open_source(src):
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        source_format = bmfile.check_data_format(src)
+        if source_format == bmfile.FILE_TYPE_INVALID:
+            raise ValueError("Data is not a valid BMFont .fnt file")
+        file = io.BytesIO(src)
+        if source_format != bmfile.FILE_TYPE_BINARY3:
+            file = io.TextIOWrapper(file, encoding = "utf-8")
+        return file, source_format
+    
+    return bmfile.open_font(src)
+
+
+# Returns the size of a source in bytes, or 0 if it's a file that can't be
+# found (opening it will fail soon enough, so it may as well fail quickly).
+# Checking a file's size can block, so for filepaths, it's done on a thread.
+async def get_source_size(src):
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return memoryview(src).nbytes
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, os.path.getsize, src)
+    except OSError:
+        return 0
+
+
+##########
+# Conversion job
+##########
+
+# One conversion, run a batch at a time on worker threads. Nothing runs between
+# batches, so a job that's waiting for its consumer holds no thread.
+class ConversionJob:
+    # Runs on a worker thread. Converts until about chunk_size characters/bytes
+    # of output are ready, and returns them joined. Sets done (and closes the
+    # source) once everything has been converted, or if anything goes wrong.
+    # Stops early if the job gets cancelled.
+    def convert_batch(self, chunk_size):
+        try:
+            if self.fragments is None:
+                self.file, source_file_type = open_source(self.src)
+                self.fragments = bmfile.convert_blocks(self.file, source_file_type, self.target_file_type)
+            
+            batch = []
+            batch_size = 0
+            for x in self.fragments:
+                batch.append(x)
+                batch_size += len(x)
+                if batch_size >= chunk_size or self.cancelled.is_set():
+                    break
+            else:
+                self.close()
+            return bmfile.join_fragments(batch, self.target_file_type)
+        except BaseException:
+            self.close()
+            raise
+    
+    
+    # Only call this while no batch is running.
+    def close(self):
+        self.done = True
+        if self.fragments is not None:
+            self.fragments.close()
+            self.fragments = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+    
+    
+    def __init__(self, _src, _target_file_type):
+        self.src = _src
+        self.target_file_type = _target_file_type
+        self.file = None
+        self.fragments = None
+        self.done = False
+        self.cancelled = threading.Event() # checked by convert_batch() between fragments
+
+
+##########
+# Async converter
+##########
+
+# Runs conversions on worker threads so the event loop never parses or encodes
+# anything itself. A job only holds one slot of the concurrency limit while it's
+# converting a batch, and gives it back while its output waits for the
+# consumer, so:
+#  - large jobs take turns with everything else, batch by batch, and some of
+#    the slots are kept for small sources, so large ones can't take them all
+#  - only conversion time counts towards the timeout, and a slow consumer
+#    doesn't hold a slot; it just stops its own job once queue_depth batches
+#    are waiting (so each job's output takes at most about
+#    queue_depth * chunk_size of memory)
+# Slots are kept per event loop, so a converter can be used from one loop after
+# another (e.g. several asyncio.run() calls).
+class AsyncConverter:
+    # Returns the semaphores that hand out slots on the given loop: "all" for
+    # every job, and "large", which large jobs need as well, so they can never
+    # take the slots kept for small ones.
+    def get_slots(self, loop):
+        slots = self.slots.get(loop)
+        if slots is None:
+            slots = {
+                "all": asyncio.Semaphore(self.concurrency),
+                "large": asyncio.Semaphore(max(1, self.concurrency - self.small_slots)),
+            }
+            self.slots[loop] = slots
+        return slots
+    
+    
+    async def acquire_slot(self, slots, small):
+        if not small:
+            await slots["large"].acquire()
+        try:
+            await slots["all"].acquire()
+        except BaseException:
+            if not small:
+                slots["large"].release()
+            raise
+    
+    
+    def release_slot(self, slots, small):
+        slots["all"].release()
+        if not small:
+            slots["large"].release()
+    
+    
+    # Runs a job batch by batch, waiting for a slot before each one and putting
+    # its output on the queue. The last item put on the queue is either None
+    # (done) or the exception that stopped the job, including an
+    # asyncio.TimeoutError once the batches together take longer than the
+    # timeout.
+    async def run_job(self, queue, src, target_file_type):
+        loop = asyncio.get_running_loop()
+        job = ConversionJob(src, target_file_type)
+        try:
+            small = await get_source_size(src) < self.small_size
+            slots = self.get_slots(loop)
+            time_left = self.timeout
+            while True:
+                await self.acquire_slot(slots, small)
+                try:
+                    start = loop.time()
+                    batch = loop.run_in_executor(self.executor, job.convert_batch, self.chunk_size)
+                    try:
+                        x = await asyncio.wait_for(asyncio.shield(batch), time_left)
+                    finally:
+                        # On a timeout or a cancel, the worker stops at the next
+                        # fragment. Waiting for it keeps the concurrency limit
+                        # honest, and the job safe to close.
+                        if not batch.done():
+                            job.cancelled.set()
+                            await asyncio.wait([batch])
+                    time_left -= loop.time() - start
+                finally:
+                    self.release_slot(slots, small)
+                if x:
+                    await queue.put(x) # waits while the consumer is behind
+                if job.done:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+            return
+        finally:
+            job.close() # between batches, so there's nothing left to read
+        await queue.put(None)
+    
+    
+    # Converts a source to the target format, yielding the output in chunks
+    # (str for text/XML, bytes for binary) as soon as they're ready.
+    # Raises asyncio.TimeoutError if the conversion takes longer than the
+    # timeout; time spent waiting for the consumer doesn't count.
+    async def stream(self, src, target_file_type):
+        queue = asyncio.Queue(self.queue_depth)
+        job = asyncio.get_running_loop().create_task(self.run_job(queue, src, target_file_type))
+        
+        try:
+            while True:
+                x = await queue.get()
+                if x is None:
+                    break
+                if isinstance(x, BaseException):
+                    raise x
+                yield x
+        finally:
+            # Only does anything if the consumer stopped early
+            if not job.done():
+                job.cancel()
+            await asyncio.wait([job])
+    
+    
+    # Converts a source to the target format. If dst (a filepath) is given, the
+    # output is written there as it arrives and None is returned; otherwise the
+    # whole output is returned as one str or bytes.
+    async def convert(self, src, target_file_type, dst = None):
+        if dst is None:
+            chunks = []
+            async for x in self.stream(src, target_file_type):
+                chunks.append(x)
+            return bmfile.join_fragments(chunks, target_file_type)
+        
+        # File writes go to the default executor, never to the conversion
+        # executor, so they never wait for a conversion batch.
+        loop = asyncio.get_running_loop()
+        new_file = await loop.run_in_executor(None, open, dst, bmfile.get_write_mode(target_file_type))
+        try:
+            async for x in self.stream(src, target_file_type):
+                await loop.run_in_executor(None, new_file.write, x)
+        finally:
+            await loop.run_in_executor(None, new_file.close)
+    
+    
+    # Stops the worker threads once running jobs have finished.
+    def shutdown(self):
+        self.executor.shutdown(wait = False)
+    
+    
+    def __init__(self, _concurrency = DEFAULT_CONCURRENCY, _timeout = DEFAULT_TIMEOUT, _chunk_size = DEFAULT_CHUNK_SIZE, _queue_depth = DEFAULT_QUEUE_DEPTH, _small_size = DEFAULT_SMALL_SIZE, _small_slots = DEFAULT_SMALL_SLOTS):
+        self.concurrency = _concurrency
+        self.timeout = _timeout
+        self.chunk_size = _chunk_size
+        self.queue_depth = _queue_depth
+        self.small_size = _small_size
+        self.small_slots = _small_slots
+        
+        self.slots = weakref.WeakKeyDictionary() # event loop -> semaphores, see get_slots()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = self.concurrency, thread_name_prefix = "bmasync")
+
+
+##########
+# Module-level shortcuts
+##########
+
+default_converter = None
+
+
+# Returns the converter used by the functions below, creating it on first use.
+def get_default_converter():
+    global default_converter
+    if default_converter is None:
+        default_converter = AsyncConverter()
+    return default_converter
+
+
+# await convert_async("example.fnt", bmfile.FILE_TYPE_BINARY3)
+async def convert_async(src, target_file_type, dst = None):
+    return await get_default_converter().convert(src, target_file_type, dst)
+
+
+# async for chunk in stream_async("example.fnt", bmfile.FILE_TYPE_XML): ...
+def stream_async(src, target_file_type):
+    return get_default_converter().stream(src, target_file_type)
@@ -0,0 +1,215 @@
+import array
+import struct
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+# The parts of a binary v3 char record the index needs: id, x, y, width,
+# height, and page.
+CHAR_RECT = struct.Struct("<IHHHH6xBx")
+
+MIN_CELL_SIZE = 8
+
+
+##########
+# Grid
+##########
+
+# A uniform grid over the rects of one atlas page. Each cell lists the rects
+# that touch it, so a query only has to look at the rects in the cells it
+# covers. Rects are half-open: a 10x10 rect at (0, 0) covers x 0-9 and y 0-9.
+class PageGrid:
+    def add(self, id, x, y, width, height):
+        self.ids.append(id)
+        self.x0.append(x)
+        self.y0.append(y)
+        self.x1.append(x + width)
+        self.y1.append(y + height)
+    
+    
+    # Sorts the rects into cells. Called once all the rects have been added.
+    # The cell size follows the average rect size, so most rects touch only a
+    # few cells, and most cells hold only a few rects.
+    def build(self):
+        count = len(self.ids)
+        if count == 0:
+            return
+        total = 0
+        for i in range(count):
+            total += max(self.x1[i] - self.x0[i], self.y1[i] - self.y0[i])
+        self.cell_size = max(MIN_CELL_SIZE, 2 * total // count)
+        self.columns = max(self.x1) // self.cell_size + 1
+        self.rows = max(self.y1) // self.cell_size + 1
+        
+        self.cells = [None] * (self.columns * self.rows)
+        for i in range(count):
+            for cell in self.get_cells(self.x0[i], self.y0[i], self.x1[i], self.y1[i]):
+                if self.cells[cell] is None:
+                    self.cells[cell] = [i]
+                else:
+                    self.cells[cell].append(i)
+    
+    
+    # Returns the indices of the cells that a half-open rect touches.
+    def get_cells(self, x0, y0, x1, y1):
+        size = self.cell_size
+        cx0 = max(0, x0 // size)
+        cy0 = max(0, y0 // size)
+        cx1 = min(self.columns - 1, (x1 - 1) // size)
+        cy1 = min(self.rows - 1, (y1 - 1) // size)
+        return [cy * self.columns + cx for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)]
+    
+    
+    # Returns the ids of the rects that overlap the given region.
+    def query_region(self, x0, y0, x1, y1):
+        if self.cells is None or x1 <= x0 or y1 <= y0:
+            return []
+        found = set()
+        for cell in self.get_cells(x0, y0, x1, y1):
+            for i in self.cells[cell] or ():
+                if self.x0[i] < x1 and x0 < self.x1[i] and self.y0[i] < y1 and y0 < self.y1[i]:
+                    found.add(i)
+        return sorted([self.ids[i] for i in found])
+    
+    
+    # Returns the ids of every pair of overlapping rects, as (lower id, higher id).
+    def find_overlaps(self):
+        if self.cells is None:
+            return []
+        size = self.cell_size
+        pairs = []
+        for cell, indices in enumerate(self.cells):
+            if indices is None or len(indices) < 2:
+                continue
+            for n, i in enumerate(indices):
+                for j in indices[n + 1:]:
+                    x0 = max(self.x0[i], self.x0[j])
+                    y0 = max(self.y0[i], self.y0[j])
+                    if x0 >= min(self.x1[i], self.x1[j]) or y0 >= min(self.y1[i], self.y1[j]):
+                        continue
+                    # Pairs that share several cells are only reported by the
+                    # cell with the top left corner of their overlap
+                    if (y0 // size) * self.columns + x0 // size == cell:
+                        a, b = self.ids[i], self.ids[j]
+                        pairs.append((min(a, b), max(a, b)))
+        pairs.sort()
+        return pairs
+    
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    
+    def __init__(self):
+        self.ids = array.array("I")
+        self.x0 = array.array("I")
+        self.y0 = array.array("I")
+        self.x1 = array.array("I")
+        self.y1 = array.array("I")
+        
+        self.cell_size = MIN_CELL_SIZE
+        self.columns = 0
+        self.rows = 0
+        self.cells = None
+
+
+##########
+# Atlas index
+##########
+
+# Finds chars by where they are on the atlas pages, instead of scanning the
+# whole char table for every question:
+#
+#   atlas = bmatlas.AtlasIndex(chars)              # list of char dictionaries
+#   atlas.query_region(2, 0, 0, 128, 64)           # ids of chars touching that region of page 2
+#   atlas.query_point(0, 37, 12)                   # ids of chars under a point on page 0
+#   atlas.find_overlaps()                          # (page, id, id) for chars that overlap
+#
+# Chars with no width or height (e.g. space) take up no room on the atlas, and
+# are left out.
+class AtlasIndex:
+    # Adds chars from an iterable of char dictionaries (e.g. what
+    # bmfile.Block4Iterator.read_entries() returns), in one pass.
+    def build(self, chars):
+        for data in chars:
+            if data["width"] > 0 and data["height"] > 0:
+                self.get_page(data["page"]).add(data["id"], data["x"], data["y"], data["width"], data["height"])
+        self.finish()
+    
+    
+    # Adds chars straight from the char block of binary v3 data (bytes, an
+    # mmap, or a memoryview, e.g. from bmbundle.Bundle.get()), without making
+    # dictionaries for them.
+    def build_binary(self, data):
+        blocks = bmfile.find_binary_blocks(data)
+        if 4 not in blocks:
+            raise ValueError("Font has no chars block")
+        offset, size = blocks[4]
+        if size % CHAR_RECT.size != 0:
+            raise ValueError("Block size {0} isn't a multiple of the record size {1}".format(size, CHAR_RECT.size))
+        for id, x, y, width, height, page in CHAR_RECT.iter_unpack(data[offset:offset + size]):
+            if width > 0 and height > 0:
+                self.get_page(page).add(id, x, y, width, height)
+        self.finish()
+    
+    
+    def get_page(self, page):
+        if page not in self.pages:
+            self.pages[page] = PageGrid()
+        return self.pages[page]
+    
+    
+    def finish(self):
+        for grid in self.pages.values():
+            grid.build()
+    
+    
+    # Returns the ids of the chars on a page that overlap the given region,
+    # sorted.
+    def query_region(self, page, x, y, width, height):
+        if page not in self.pages:
+            return []
+        return self.pages[page].query_region(x, y, x + width, y + height)
+    
+    
+    # Returns the ids of the chars on a page that cover the given pixel, sorted.
+    def query_point(self, page, x, y):
+        return self.query_region(page, x, y, 1, 1)
+    
+    
+    # Returns every pair of overlapping chars as (page, lower id, higher id),
+    # for one page or (by default) all of them. A correctly packed atlas has
+    # none.
+    def find_overlaps(self, page = None):
+        pages = sorted(self.pages) if page is None else [page]
+        return [(p, a, b) for p in pages if p in self.pages for a, b in self.pages[p].find_overlaps()]
+    
+    
+    def get_pages(self):
+        return sorted(self.pages)
+    
+    
+    def __len__(self):
+        return sum([len(grid) for grid in self.pages.values()])
+    
+    
+    def __init__(self, _chars = None):
+        self.pages = {}
+        
+        if _chars is not None:
+            self.build(_chars)
+
+
+# Builds an atlas index for a .fnt file of any format. Binary files are read
+# straight from their char records.
+def index_file(filepath):
+    atlas = AtlasIndex()
+    file, source_format = bmfile.open_font(filepath)
+    if source_format == bmfile.FILE_TYPE_BINARY3:
+        atlas.build_binary(file.read())
+    else:
+        atlas.build(bmfile.read_font(file, source_format)["chars"])
+    file.close()
+    return atlas
@@ -0,0 +1,249 @@
+import io
+import mmap
+import os
+import struct
+import sys
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+# Bundle file layout (all little-endian):
+#   header (32 bytes): magic, version, font count, reserved, directory offset, names offset
+#   directory: one 32-byte entry per font, sorted by name hash (then name):
+#     u64 name hash, u64 font offset, u64 font length, u32 name offset, u32 name length
+#   names: the UTF-8 font names, back to back
+#   fonts: each font as a complete binary v3 file, back to back
+# Everything before the fonts has a fixed size for a given set of names, so a
+# bundle can be written in one pass without holding all the fonts in memory.
+BUNDLE_MAGIC = b'BMFB'
+BUNDLE_VERSION = 1
+BUNDLE_HEADER = struct.Struct("<4sIIIQQ")
+BUNDLE_ENTRY = struct.Struct("<QQQII")
+
+FNV_OFFSET_BASIS = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+
+
+##########
+# Utility functions
+##########
+
+# 64-bit FNV-1a. Unlike hash(), it's the same in every process, so it can be
+# stored in a file.
+def name_hash(name):
+    h = FNV_OFFSET_BASIS
+    for b in bytes(name, "utf-8"):
+        h = ((h ^ b) * FNV_PRIME) & 0xFFFFFFFFFFFFFFFF
+    return h
+
+
+# Returns whether a font name is a plain file name, so unpacking it can't write
+# outside the target directory: no directories (with either kind of slash),
+# nothing absolute, and not "." or "..".
+def is_safe_name(name):
+    if name in ["", ".", ".."] or "/" in name or "\\" in name or "\0" in name:
+        return False
+    return os.path.basename(name) == name and not os.path.isabs(name)
+
+
+# Converts a .fnt file of any format to binary v3, and writes it to an open
+# file. Returns the number of bytes written.
+def write_binary(filepath, new_file):
+    size = 0
+    original_file, source_format = bmfile.open_font(filepath)
+    for x in bmfile.convert_blocks(original_file, source_format, bmfile.FILE_TYPE_BINARY3):
+        new_file.write(x)
+        size += len(x)
+    original_file.close()
+    return size
+
+
+##########
+# Packing
+##########
+
+# Packs .fnt files (any format) into a bundle. Fonts are stored under their
+# file name unless a list of names is given.
+def pack(bundle_filepath, filepaths, names = None):
+    if names is None:
+        names = [os.path.basename(x) for x in filepaths]
+    if len(set(names)) != len(names):
+        raise ValueError("Font names in a bundle must be unique")
+    for name in names:
+        if not is_safe_name(name):
+            raise ValueError("{0!r} can't be used as a font name; names must be plain file names".format(name))
+    
+    encoded_names = [bytes(x, "utf-8") for x in names]
+    directory_offset = BUNDLE_HEADER.size
+    names_offset = directory_offset + BUNDLE_ENTRY.size * len(names)
+    fonts_offset = names_offset + sum([len(x) for x in encoded_names])
+    
+    # Fonts go in first, since their sizes are only known after converting them
+    new_file = open(bundle_filepath, "wb")
+    new_file.seek(fonts_offset)
+    entries = []
+    name_pos = names_offset
+    for i in range(len(names)):
+        offset = new_file.tell()
+        length = write_binary(filepaths[i], new_file)
+        entries.append((name_hash(names[i]), encoded_names[i], offset, length, name_pos))
+        name_pos += len(encoded_names[i])
+    
+    new_file.seek(0)
+    new_file.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(names), 0, directory_offset, names_offset))
+    for h, name, offset, length, name_offset in sorted(entries):
+        new_file.write(BUNDLE_ENTRY.pack(h, offset, length, name_offset, len(name)))
+    new_file.write(bytes().join(encoded_names))
+    new_file.close()
+
+
+# Writes every font in a bundle back out as a separate file in target_format.
+# Bundles from elsewhere may have names that would escape the directory, so if
+# any name isn't a plain file name, nothing is written.
+def unpack(bundle_filepath, directory, target_format = bmfile.FILE_TYPE_BINARY3):
+    bundle = Bundle(bundle_filepath)
+    try:
+        for name in bundle.get_names():
+            if not is_safe_name(name):
+                raise ValueError("Bundle has a font named {0!r}, which isn't a plain file name".format(name))
+        for name in bundle.get_names():
+            new_file = open(os.path.join(directory, name), bmfile.get_write_mode(target_format))
+            if target_format == bmfile.FILE_TYPE_BINARY3:
+                new_file.write(bundle.get(name))
+            else:
+                for x in bmfile.convert_blocks(bundle.open_font(name), bmfile.FILE_TYPE_BINARY3, target_format):
+                    new_file.write(x)
+            new_file.close()
+    finally:
+        bundle.close()
+
+
+##########
+# Loading
+##########
+
+# A bundle opened for reading. The file is memory-mapped, so opening it only
+# reads the header; fonts are paged in by the OS when they're first touched.
+#
+#   bundle = bmbundle.Bundle("fonts.fntb")
+#   data = bundle.get("example.fnt")        # memoryview of the binary v3 file, no copy
+#   file = bundle.open_font("example.fnt")  # file-like object for bmfile's readers
+class Bundle:
+    def get_entry(self, i):
+        return BUNDLE_ENTRY.unpack_from(self.data, self.directory_offset + i * BUNDLE_ENTRY.size)
+    
+    
+    def get_entry_name(self, entry):
+        return bytes(self.view[entry[3]:entry[3] + entry[4]]).decode("utf-8")
+    
+    
+    # Binary search over the directory, straight from the mapped file.
+    # Returns the entry for the name, or None.
+    def find(self, name):
+        h = name_hash(name)
+        encoded_name = bytes(name, "utf-8")
+        low = 0
+        high = self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.get_entry(mid)[0] < h:
+                low = mid + 1
+            else:
+                high = mid
+        
+        # Walk over every entry with this hash, in case of collisions
+        while low < self.count:
+            entry = self.get_entry(low)
+            if entry[0] != h:
+                break
+            if self.view[entry[3]:entry[3] + entry[4]] == encoded_name:
+                return entry
+            low += 1
+        return None
+    
+    
+    # Returns a font's binary v3 data as a memoryview into the mapped file.
+    # Raises KeyError if there's no such font.
+    def get(self, name):
+        entry = self.find(name)
+        if entry is None:
+            raise KeyError(name)
+        return self.view[entry[1]:entry[1] + entry[2]]
+    
+    
+    # Returns a font as a file-like object that bmfile's binary readers accept.
+    def open_font(self, name):
+        return io.BytesIO(self.get(name))
+    
+    
+    def get_names(self):
+        return [self.get_entry_name(self.get_entry(i)) for i in range(self.count)]
+    
+    
+    def __contains__(self, name):
+        return self.find(name) is not None
+    
+    
+    def __len__(self):
+        return self.count
+    
+    
+    def close(self):
+        # Slices handed out by get() must be released before the map can close
+        self.view.release()
+        self.data.close()
+        self.file.close()
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    
+    def __init__(self, _filepath):
+        self.file = open(_filepath, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        
+        magic, version, self.count, reserved, self.directory_offset, self.names_offset = BUNDLE_HEADER.unpack_from(self.data, 0)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            self.close()
+            raise ValueError("Not a BMFont bundle")
+
+
+##########
+# Command line
+##########
+
+USAGE = """Usage:
+  python3 bmbundle.py pack <bundle> <fnt files...>
+  python3 bmbundle.py unpack <bundle> <directory> [t|x|b|j|jc]
+  python3 bmbundle.py list <bundle>"""
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    
+    if len(args) >= 3 and args[0] == "pack":
+        pack(args[1], args[2:])
+        print("Packed {0} fonts into {1}".format(len(args) - 2, args[1]))
+    elif len(args) >= 3 and args[0] == "unpack":
+        target_format = bmfile.FILE_TYPE_BINARY3
+        if len(args) >= 4:
+            valid_inputs = ["t", "x", "b", "j", "jc"]
+            if args[3] not in valid_inputs:
+                print("Invalid selection for output format")
+                quit()
+            target_format = valid_inputs.index(args[3])
+        unpack(args[1], args[2], target_format)
+    elif len(args) == 2 and args[0] == "list":
+        bundle = Bundle(args[1])
+        for name in bundle.get_names():
+            print("{0} ({1} bytes)".format(name, len(bundle.get(name))))
+        bundle.close()
+    else:
+        print(USAGE)
@@ -0,0 +1,221 @@
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+# Expected sizes of the binary v3 blocks: (minimum size, record size).
+# Block 1 ends in a null-terminated font name, block 3 holds equal-length
+# null-terminated page names, and blocks 4 and 5 are arrays of records.
+BINARY3_BLOCK_SIZES = {
+    1: (15, None),
+    2: (15, None),
+    3: (0, None),
+    4: (0, bmfile.Block4Iterator.BLOCK_4_BINARY3_ENTRY_SIZE),
+    5: (0, bmfile.Block5Iterator.BLOCK_5_BINARY3_ENTRY_SIZE),
+}
+BINARY3_COMMON_BLOCK_SIZE = 15
+
+# The start of a page, char, or kerning entry, in text or XML, and what it's
+# called, by block type.
+ENTRY_PATTERNS = {
+    3: ("pages", r'\s*<?page\s'),
+    4: ("chars", r'\s*<?char\s'),
+    5: ("kernings", r'\s*<?kerning\s'),
+}
+
+# A badly broken font can have a problem with every char; past this many,
+# problems are only counted.
+MAX_ISSUES = 100
+
+
+##########
+# Validator
+##########
+
+# Checks a font's data for problems as it goes through bmfile.convert_blocks(),
+# so a conversion validates the font for almost nothing extra:
+#  - chars whose rect doesn't fit inside the page (scaleW x scaleH)
+#  - chars on a page the font doesn't have
+#  - chars with the same id as an earlier char
+#  - kernings that refer to a char the font doesn't have
+#  - in binary, blocks whose header doesn't match what was written after it,
+#    or whose size doesn't fit their records
+#  - with bmfile.read_font() (see check_file()), more entries than a block's
+#    count says
+#
+#   validator = bmcheck.FontValidator()
+#   for x in bmfile.convert_blocks(file, source_format, target_format, listeners = [validator]):
+#       new_file.write(x)
+#   for issue in validator.issues:
+#       print(issue)
+#
+# Kernings are checked as they're written, so with a kerning filter that
+# removes pairs for missing chars (see bmkerning), those never show up here.
+class FontValidator:
+    def add_issue(self, message):
+        self.issue_count += 1
+        if len(self.issues) < MAX_ISSUES:
+            self.issues.append(message)
+    
+    
+    def on_common(self, data):
+        self.scale_w = data["scaleW"]
+        self.scale_h = data["scaleH"]
+        self.page_count = data["pages"]
+    
+    
+    def on_char(self, data):
+        id = data["id"]
+        if id in self.char_ids:
+            self.add_issue("Char {0} appears more than once".format(id))
+        else:
+            self.char_ids.add(id)
+        
+        if data["page"] >= self.page_count:
+            self.add_issue("Char {0} is on page {1}, but the font only has {2} pages".format(id, data["page"], self.page_count))
+        if data["x"] + data["width"] > self.scale_w or data["y"] + data["height"] > self.scale_h:
+            self.add_issue("Char {0} ({1}x{2} at {3},{4}) doesn't fit on a {5}x{6} page".format(id, data["width"], data["height"], data["x"], data["y"], self.scale_w, self.scale_h))
+    
+    
+    def on_kerning(self, data):
+        for key in ["first", "second"]:
+            if data[key] not in self.char_ids:
+                self.add_issue("Kerning {0},{1} refers to char {2}, which isn't in the font".format(data["first"], data["second"], data[key]))
+                break
+    
+    
+    # Binary only: checks each block as it's written.
+    def on_block(self, block_type, header, size):
+        self.blocks.append(block_type)
+        if len(header) < 5:
+            self.add_issue("Block {0} was written without a complete header".format(block_type))
+            return
+        if header[0] != block_type:
+            self.add_issue("Block {0} was written as block type {1}".format(block_type, header[0]))
+        declared_size = int.from_bytes(header[1:5], "little")
+        if declared_size != size:
+            self.add_issue("Block {0} says it's {1} bytes, but {2} were written".format(block_type, declared_size, size))
+        for issue in check_block_size(block_type, size):
+            self.add_issue(issue)
+        if block_type == 3 and self.page_count and size % self.page_count != 0:
+            self.add_issue("Block 3 is {0} bytes, which can't hold {1} page names of the same length".format(size, self.page_count))
+    
+    
+    # Text, XML, and JSON give the number of pages, chars, and kernings up
+    # front, and readers stop after that many, so any more would be silently
+    # dropped. bmfile.read_font() reports the line after a block's last entry
+    # if it's out of place.
+    def on_unexpected_line(self, block_type, x):
+        name, pattern = ENTRY_PATTERNS[block_type]
+        if bmfile.pattern(pattern).match(x):
+            self.add_issue("There are more {0} than the {0} count says".format(name))
+        else:
+            self.add_issue("Expected the end of the {0}, but found {1!r}".format(name, x.strip()))
+    
+    
+    def on_end(self):
+        if not self.blocks:
+            return # not converted to binary
+        for block_type in [1, 2, 3, 4]:
+            if block_type not in self.blocks:
+                self.add_issue("Block {0} is missing".format(block_type))
+    
+    
+    def is_valid(self):
+        return self.issue_count == 0
+    
+    
+    def __init__(self):
+        self.issues = []
+        self.issue_count = 0
+        
+        self.scale_w = 0
+        self.scale_h = 0
+        self.page_count = 0
+        self.char_ids = set()
+        self.blocks = []
+
+
+##########
+# Standalone checks
+##########
+
+# Checks a binary v3 block's size against its type. Returns a list of issues.
+def check_block_size(block_type, size):
+    minimum, record_size = BINARY3_BLOCK_SIZES.get(block_type, (0, None))
+    if size < minimum:
+        return ["Block {0} is {1} bytes, but must be at least {2}".format(block_type, size, minimum)]
+    if block_type == 2 and size != BINARY3_COMMON_BLOCK_SIZE:
+        return ["Block 2 is {0} bytes, but must be {1}".format(size, BINARY3_COMMON_BLOCK_SIZE)]
+    if record_size is not None and size % record_size != 0:
+        return ["Block {0} is {1} bytes, which isn't a whole number of {2}-byte records".format(block_type, size, record_size)]
+    return []
+
+
+# Walks the block headers of a binary v3 file and checks each block's size
+# against what its contents need. Only the headers (and blocks 2 and 3, for
+# the page names) are read. Returns a list of issues.
+def check_binary_blocks(file):
+    issues = []
+    seen = []
+    page_count = None
+    try:
+        for block_type, start, size in bmfile.iter_binary_blocks(file):
+            if block_type not in BINARY3_BLOCK_SIZES:
+                issues.append("Unknown block type {0}".format(block_type))
+            elif block_type in seen:
+                issues.append("Block {0} appears more than once".format(block_type))
+            elif seen and block_type < seen[-1]:
+                issues.append("Block {0} comes after block {1}".format(block_type, seen[-1]))
+            seen.append(block_type)
+            
+            size_issues = check_block_size(block_type, size)
+            if size_issues:
+                issues += size_issues
+            elif block_type == 2:
+                file.seek(start + 8)
+                page_count = int.from_bytes(file.read(2), "little")
+            elif block_type == 3 and page_count:
+                if size % page_count != 0:
+                    issues.append("Block 3 is {0} bytes, which can't hold {1} page names of the same length".format(size, page_count))
+                else:
+                    file.seek(start)
+                    names = file.read(size)
+                    length = size // page_count
+                    if any([names[i * length + length - 1] != 0 for i in range(page_count)]):
+                        issues.append("Block 3 page names aren't null-terminated")
+    except ValueError as e:
+        issues.append(str(e))
+    
+    for block_type in [1, 2, 3, 4]:
+        if block_type not in seen:
+            issues.append("Block {0} is missing".format(block_type))
+    return issues
+
+
+# Checks a .fnt file of any format without converting it. Returns a
+# FontValidator; for binary files, problems with the block sizes are in its
+# issues too. Files that can't be read at all get a single issue saying why.
+def check_file(filepath):
+    validator = FontValidator()
+    try:
+        file, source_format = bmfile.open_font(filepath)
+    except ValueError:
+        validator.add_issue("Not a BMFont .fnt file")
+        return validator
+    
+    try:
+        if source_format == bmfile.FILE_TYPE_BINARY3:
+            for issue in check_binary_blocks(file):
+                validator.add_issue(issue)
+            file.seek(0)
+            if not validator.is_valid():
+                return validator # the records can't be trusted to line up
+        
+        bmfile.read_font(file, source_format, [validator])
+    except Exception as e:
+        validator.add_issue("Couldn't be read ({0}: {1})".format(type(e).__name__, e))
+    finally:
+        file.close()
+    return validator
@@ -0,0 +1,366 @@
+import io
+import os
+import struct
+import sys
+import zlib
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+# Delta file layout (all little-endian, zlib-compressed as a whole):
+#   header: magic, version, old size, old CRC32, new size, new CRC32
+#   then one entry per block of the new font, in order: u8 block type, u8 mode
+#     DELTA_COPY:    nothing else; the block is the same as in the old font
+#     DELTA_REPLACE: u32 size, then the whole block
+#     DELTA_MERGE:   u32 new size, u32 delete count, u32 upsert count,
+#                    the keys of deleted records, then the upserted records
+#     DELTA_SPLICE:  u32 new size, u32 op count, then the ops:
+#                    SPLICE_COPY, u32 old index, u32 count
+#                    SPLICE_INSERT, u32 count, then the records
+# Merges are for the chars and kernings blocks. Upserted records either
+# replace the old record with the same key or are inserted where their key
+# sorts, so a patch is a single merge over the old records. Merging needs
+# records sorted by key (which is how BMFont writes them); blocks that aren't
+# get spliced instead, which copies runs of old records by position. Either
+# way the old records are only read once, front to back.
+DELTA_MAGIC = b'BMFD'
+DELTA_VERSION = 1
+DELTA_HEADER = struct.Struct("<4sIQIQI")
+DELTA_EXTENSION = ".fntd"
+
+DELTA_COPY = 0
+DELTA_REPLACE = 1
+DELTA_MERGE = 2
+DELTA_SPLICE = 3
+
+SPLICE_COPY = 0
+SPLICE_INSERT = 1
+
+# Block type: (record size, struct for the record's key).
+# Chars are keyed by id, kernings by (first, second).
+RECORD_KEYS = {
+    4: (bmfile.Block4Iterator.BLOCK_4_BINARY3_ENTRY_SIZE, struct.Struct("<I")),
+    5: (bmfile.Block5Iterator.BLOCK_5_BINARY3_ENTRY_SIZE, struct.Struct("<II")),
+}
+
+# How much a patch reads from the old font at a time.
+RECORDS_PER_READ = 4096
+COPY_CHUNK_SIZE = 65536
+
+
+##########
+# Utility functions
+##########
+
+# Returns a font as binary v3 data. Other formats are converted in memory, so
+# deltas can be made between fonts in any format; patching always gives
+# binary v3.
+def load_binary(filepath):
+    file, source_format = bmfile.open_font(filepath)
+    if source_format == bmfile.FILE_TYPE_BINARY3:
+        data = file.read()
+    else:
+        data = bmfile.join_fragments(bmfile.convert_blocks(file, source_format, bmfile.FILE_TYPE_BINARY3), bmfile.FILE_TYPE_BINARY3)
+    file.close()
+    return bytes(data)
+
+
+# Splits a block into its records.
+def get_records(data, block, record_size):
+    offset, size = block
+    return [data[i:i + record_size] for i in range(offset, offset + size, record_size)]
+
+
+# Returns whether every record's key is greater than the one before it.
+def is_sorted(records, key):
+    keys = [key.unpack_from(x) for x in records]
+    return all([keys[i] < keys[i + 1] for i in range(len(keys) - 1)])
+
+
+# Merges sorted old records with a delta's deletes and upserts (also sorted),
+# yielding the new records in order.
+def merge_records(old_records, deletes, upserts, key):
+    i = 0
+    d = 0
+    for x in old_records:
+        k = key.unpack_from(x)
+        while i < len(upserts) and key.unpack_from(upserts[i]) < k:
+            yield upserts[i]
+            i += 1
+        if i < len(upserts) and key.unpack_from(upserts[i]) == k:
+            yield upserts[i]
+            i += 1
+            continue
+        while d < len(deletes) and deletes[d] < k:
+            d += 1
+        if d < len(deletes) and deletes[d] == k:
+            continue
+        yield x
+    yield from upserts[i:]
+
+
+# Applies a delta's splice ops to the old records, yielding the new records in
+# order. Copies always move forward through the old records.
+def splice_records(old_records, ops):
+    old_records = iter(old_records)
+    pos = 0
+    for op, data in ops:
+        if op == SPLICE_COPY:
+            start, count = data
+            for i in range(start - pos):
+                next(old_records)
+            for i in range(count):
+                yield next(old_records)
+            pos = start + count
+        else:
+            yield from data
+
+
+##########
+# Diff
+##########
+
+# Works out the deletes and upserts that turn one block's records into
+# another's. Returns the encoded merge entry, or None if the records aren't
+# sorted by key (e.g. after grouping chars by page), which a merge relies on.
+def diff_records(old_records, new_records, key):
+    if not is_sorted(old_records, key) or not is_sorted(new_records, key):
+        return None
+    
+    old = {key.unpack_from(x): x for x in old_records}
+    new = {key.unpack_from(x): x for x in new_records}
+    deletes = sorted([k for k in old if k not in new])
+    upserts = [x for x in new_records if old.get(key.unpack_from(x)) != x]
+    
+    x = bytearray()
+    x += struct.pack("<III", sum([len(x) for x in new_records]), len(deletes), len(upserts))
+    for k in deletes:
+        x += key.pack(*k)
+    for record in upserts:
+        x += record
+    return x
+
+
+# Works out which runs of old records can be copied to make the new records,
+# by position rather than key. Returns the encoded splice entry.
+def diff_splice(old_records, new_records):
+    import difflib
+    matcher = difflib.SequenceMatcher(None, old_records, new_records, autojunk = False)
+    ops = bytearray()
+    count = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops += struct.pack("<BII", SPLICE_COPY, i1, i2 - i1)
+            count += 1
+        elif j2 > j1:
+            ops += struct.pack("<BI", SPLICE_INSERT, j2 - j1) + bytes().join(new_records[j1:j2])
+            count += 1
+    return struct.pack("<II", sum([len(x) for x in new_records]), count) + ops
+
+
+# Makes a delta that turns the old font into the new one. Returns it as bytes.
+def diff(old_filepath, new_filepath):
+    old_data = load_binary(old_filepath)
+    new_data = load_binary(new_filepath)
+    old_blocks = bmfile.find_binary_blocks(old_data)
+    new_blocks = bmfile.find_binary_blocks(new_data)
+    
+    x = bytearray(DELTA_HEADER.pack(DELTA_MAGIC, DELTA_VERSION, len(old_data), zlib.crc32(old_data), len(new_data), zlib.crc32(new_data)))
+    for block_type, (offset, size) in new_blocks.items():
+        new_block = new_data[offset:offset + size]
+        if block_type in old_blocks:
+            old_offset, old_size = old_blocks[block_type]
+            if old_data[old_offset:old_offset + old_size] == new_block:
+                x += bytes([block_type, DELTA_COPY])
+                continue
+            
+            if block_type in RECORD_KEYS:
+                record_size, key = RECORD_KEYS[block_type]
+                old_records = get_records(old_data, old_blocks[block_type], record_size)
+                new_records = get_records(new_data, new_blocks[block_type], record_size)
+                merge = diff_records(old_records, new_records, key)
+                if merge is not None:
+                    mode = DELTA_MERGE
+                else:
+                    mode = DELTA_SPLICE
+                    merge = diff_splice(old_records, new_records)
+                if len(merge) < size:
+                    x += bytes([block_type, mode]) + merge
+                    continue
+        
+        x += bytes([block_type, DELTA_REPLACE]) + size.to_bytes(4, "little") + new_block
+    return zlib.compress(bytes(x), 9)
+
+
+def diff_files(old_filepath, new_filepath, delta_filepath):
+    x = diff(old_filepath, new_filepath)
+    file = open(delta_filepath, "wb")
+    file.write(x)
+    file.close()
+    return len(x)
+
+
+##########
+# Patch
+##########
+
+# Reads a delta's block entries. Returns a list of (block type, mode, data),
+# where data is the new block for DELTA_REPLACE, (new size, deletes, upserts)
+# for DELTA_MERGE, and (new size, ops) for DELTA_SPLICE.
+def read_delta_entries(x, pos):
+    entries = []
+    while pos < len(x):
+        block_type, mode = x[pos], x[pos + 1]
+        pos += 2
+        if mode == DELTA_COPY:
+            entries.append((block_type, mode, None))
+        elif mode == DELTA_REPLACE:
+            size = int.from_bytes(x[pos:pos + 4], "little")
+            entries.append((block_type, mode, x[pos + 4:pos + 4 + size]))
+            pos += 4 + size
+        elif mode == DELTA_MERGE:
+            record_size, key = RECORD_KEYS[block_type]
+            size, delete_count, upsert_count = struct.unpack_from("<III", x, pos)
+            pos += 12
+            deletes = [key.unpack_from(x, pos + i * key.size) for i in range(delete_count)]
+            pos += delete_count * key.size
+            upserts = [x[pos + i * record_size:pos + (i + 1) * record_size] for i in range(upsert_count)]
+            pos += upsert_count * record_size
+            entries.append((block_type, mode, (size, deletes, upserts)))
+        elif mode == DELTA_SPLICE:
+            record_size = RECORD_KEYS[block_type][0]
+            size, count = struct.unpack_from("<II", x, pos)
+            pos += 8
+            ops = []
+            for i in range(count):
+                if x[pos] == SPLICE_COPY:
+                    ops.append((SPLICE_COPY, struct.unpack_from("<II", x, pos + 1)))
+                    pos += 9
+                else:
+                    n = int.from_bytes(x[pos + 1:pos + 5], "little")
+                    pos += 5
+                    ops.append((SPLICE_INSERT, [x[pos + j * record_size:pos + (j + 1) * record_size] for j in range(n)]))
+                    pos += n * record_size
+            entries.append((block_type, mode, (size, ops)))
+        else:
+            raise ValueError("Unknown delta mode {0}".format(mode))
+    return entries
+
+
+# Yields a block of the old font in chunks of up to chunk_size bytes.
+def read_block(file, block, chunk_size):
+    offset, size = block
+    file.seek(offset)
+    while size > 0:
+        x = file.read(min(size, chunk_size))
+        if len(x) == 0:
+            raise ValueError("Font ends in the middle of a block")
+        size -= len(x)
+        yield x
+
+
+# Yields the records of a block of the old font one by one.
+def read_records(file, block, record_size):
+    for x in read_block(file, block, RECORDS_PER_READ * record_size):
+        for i in range(0, len(x), record_size):
+            yield x[i:i + record_size]
+
+
+# Returns the CRC32 of a whole file, reading it a chunk at a time.
+def get_file_crc(file):
+    crc = 0
+    file.seek(0)
+    x = file.read(io.DEFAULT_BUFFER_SIZE * 16)
+    while x:
+        crc = zlib.crc32(x, crc)
+        x = file.read(io.DEFAULT_BUFFER_SIZE * 16)
+    return crc
+
+
+# Applies a delta (bytes, as returned by diff()) to the old font, writing the
+# new font to new_filepath. The old font has to be binary v3, and exactly the
+# one the delta was made from. The old font is read as a stream, so memory use
+# depends on the size of the delta, not the font. The result is checked
+# against the new font's CRC32, and removed again if it doesn't match.
+def patch(old_filepath, delta, new_filepath):
+    x = zlib.decompress(delta)
+    magic, version, old_size, old_crc, new_size, new_crc = DELTA_HEADER.unpack_from(x, 0)
+    if magic != DELTA_MAGIC or version != DELTA_VERSION:
+        raise ValueError("Not a BMFont delta")
+    entries = read_delta_entries(x, DELTA_HEADER.size)
+    
+    old_file = open(old_filepath, "rb")
+    new_file = None
+    try:
+        if os.fstat(old_file.fileno()).st_size != old_size or get_file_crc(old_file) != old_crc:
+            raise ValueError("{0} isn't the font this delta was made from".format(old_filepath))
+        old_blocks = bmfile.find_binary_blocks(old_file)
+        
+        new_file = open(new_filepath, "wb")
+        crc = 0
+        header = bmfile.get_file_header(bmfile.FILE_TYPE_BINARY3)
+        new_file.write(header)
+        crc = zlib.crc32(header, crc)
+        for block_type, mode, data in entries:
+            if mode == DELTA_COPY:
+                size = old_blocks[block_type][1]
+                chunks = read_block(old_file, old_blocks[block_type], COPY_CHUNK_SIZE)
+            elif mode == DELTA_REPLACE:
+                size = len(data)
+                chunks = [data]
+            elif mode == DELTA_MERGE:
+                size, deletes, upserts = data
+                record_size, key = RECORD_KEYS[block_type]
+                chunks = merge_records(read_records(old_file, old_blocks[block_type], record_size), deletes, upserts, key)
+            else:
+                size, ops = data
+                record_size = RECORD_KEYS[block_type][0]
+                chunks = splice_records(read_records(old_file, old_blocks[block_type], record_size), ops)
+            
+            x = bytes([block_type]) + size.to_bytes(4, "little")
+            new_file.write(x)
+            crc = zlib.crc32(x, crc)
+            for x in chunks:
+                new_file.write(x)
+                crc = zlib.crc32(x, crc)
+        
+        if new_file.tell() != new_size or crc != new_crc:
+            raise ValueError("Patched font doesn't match the one the delta was made from")
+    except:
+        if new_file is not None:
+            new_file.close()
+            os.remove(new_filepath)
+        raise
+    finally:
+        old_file.close()
+    new_file.close()
+
+
+def patch_file(old_filepath, delta_filepath, new_filepath):
+    file = open(delta_filepath, "rb")
+    delta = file.read()
+    file.close()
+    patch(old_filepath, delta, new_filepath)
+
+
+##########
+# Command line
+##########
+
+USAGE = """Usage:
+  python3 bmdelta.py diff <old fnt> <new fnt> <delta>
+  python3 bmdelta.py patch <old fnt> <delta> <new fnt>"""
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    
+    if len(args) == 4 and args[0] == "diff":
+        size = diff_files(args[1], args[2], args[3])
+        print("Delta saved as {0} ({1} bytes)".format(args[3], size))
+    elif len(args) == 4 and args[0] == "patch":
+        patch_file(args[1], args[2], args[3])
+        print("Patched font saved as {0}".format(args[3]))
+    else:
+        print(USAGE)
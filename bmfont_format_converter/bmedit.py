@@ -0,0 +1,227 @@
+import mmap
+import os
+import struct
+import zlib
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+CHAR_ENTRY_SIZE = bmfile.Block4Iterator.BLOCK_4_BINARY3_ENTRY_SIZE
+KERNING_ENTRY_SIZE = bmfile.Block5Iterator.BLOCK_5_BINARY3_ENTRY_SIZE
+
+# Where each editable field sits inside a binary v3 record:
+# name: (offset, size, signed)
+CHAR_FIELDS = {
+    "x": (4, 2, False),
+    "y": (6, 2, False),
+    "width": (8, 2, False),
+    "height": (10, 2, False),
+    "xoffset": (12, 2, True),
+    "yoffset": (14, 2, True),
+    "xadvance": (16, 2, True),
+    "page": (18, 1, False),
+    "chnl": (19, 1, False),
+}
+KERNING_FIELDS = {
+    "amount": (8, 2, True),
+}
+
+# Journal file layout (all little-endian):
+#   magic, entry count
+#   entries: u64 file offset, u32 length, original bytes
+#   u32 CRC32 of everything above
+# The journal holds the original bytes of every record an edit is about to
+# touch. It's written and synced before the font is changed, and deleted once
+# the changes are synced, so if it's still around, an edit was interrupted.
+JOURNAL_MAGIC = b'BMFJ'
+JOURNAL_EXTENSION = ".journal"
+JOURNAL_HEADER = struct.Struct("<4sI")
+JOURNAL_ENTRY_HEADER = struct.Struct("<QI")
+
+
+##########
+# Utility functions
+##########
+
+def get_journal_filepath(filepath):
+    return filepath + JOURNAL_EXTENSION
+
+
+# Packs a value into a field, checking that it fits.
+def encode_field(field, value):
+    offset, size, signed = field
+    try:
+        return value.to_bytes(size, "little", signed = signed)
+    except OverflowError:
+        raise ValueError("{0} doesn't fit in a {1}-byte field".format(value, size))
+
+
+# Undoes an interrupted edit, if there was one, by copying the original bytes
+# from the journal back into the font. A journal that was never completely
+# written means the font wasn't touched yet, so it's just thrown away.
+# Returns True if anything was restored.
+def recover(filepath):
+    journal_filepath = get_journal_filepath(filepath)
+    try:
+        file = open(journal_filepath, "rb")
+    except FileNotFoundError:
+        return False
+    x = file.read()
+    file.close()
+    
+    entries = []
+    complete = False
+    if len(x) >= JOURNAL_HEADER.size + 4 and int.from_bytes(x[-4:], "little") == zlib.crc32(x[:-4]):
+        magic, count = JOURNAL_HEADER.unpack_from(x, 0)
+        pos = JOURNAL_HEADER.size
+        if magic == JOURNAL_MAGIC:
+            for i in range(count):
+                offset, length = JOURNAL_ENTRY_HEADER.unpack_from(x, pos)
+                pos += JOURNAL_ENTRY_HEADER.size
+                entries.append((offset, x[pos:pos + length]))
+                pos += length
+            complete = True
+    
+    if complete and entries:
+        file = open(filepath, "r+b")
+        for offset, original in entries:
+            file.seek(offset)
+            file.write(original)
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+    
+    os.remove(journal_filepath)
+    return complete and len(entries) > 0
+
+
+def write_journal(filepath, entries):
+    x = bytearray(JOURNAL_HEADER.pack(JOURNAL_MAGIC, len(entries)))
+    for offset, original in entries:
+        x += JOURNAL_ENTRY_HEADER.pack(offset, len(original))
+        x += original
+    x += zlib.crc32(x).to_bytes(4, "little")
+    
+    file = open(filepath, "wb")
+    file.write(x)
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+
+
+##########
+# Editor
+##########
+
+# Changes char and kerning fields of a binary v3 font in place, without
+# rewriting the file. Edits are collected first, then applied together:
+#
+#   editor = bmedit.FontEditor("example.fnt")
+#   editor.set_char(65, xadvance = 12, xoffset = -1)
+#   editor.set_kerning(65, 86, -3)
+#   editor.apply()
+#
+# Only existing records can be changed; adding or removing chars and kernings
+# changes the size of the file, which needs a full conversion.
+class FontEditor:
+    def set_char(self, id, **fields):
+        for name in fields:
+            if name not in CHAR_FIELDS:
+                raise KeyError("Char field {0} can't be edited".format(name))
+        self.char_edits.setdefault(id, {}).update(fields)
+    
+    
+    def set_kerning(self, first, second, amount):
+        self.kerning_edits[(first, second)] = {"amount": amount}
+    
+    
+    # Finds the record of every edited key with one pass over the block.
+    # Returns a dictionary of key: offset of the record in the file.
+    def locate(self, data, block, entry_size, key_format, edits):
+        offset, size = block
+        if size % entry_size != 0:
+            raise ValueError("Block size {0} isn't a multiple of the record size {1}".format(size, entry_size))
+        
+        found = {}
+        key_struct = struct.Struct(key_format)
+        for i, key in enumerate(key_struct.iter_unpack(data[offset:offset + size])):
+            if len(key) == 1:
+                key = key[0]
+            if key in edits and key not in found:
+                found[key] = offset + i * entry_size
+        
+        missing = [key for key in edits if key not in found]
+        if missing:
+            raise KeyError("Not found in the font: {0}".format(missing))
+        return found
+    
+    
+    # Works out the new bytes for every edited record. Returns a list of
+    # (offset, original bytes, new bytes).
+    def plan(self, data, found, edits, fields, entry_size):
+        changes = []
+        for key, offset in found.items():
+            original = bytes(data[offset:offset + entry_size])
+            x = bytearray(original)
+            for name, value in edits[key].items():
+                field = fields[name]
+                x[field[0]:field[0] + field[1]] = encode_field(field, value)
+            if x != original:
+                changes.append((offset, original, bytes(x)))
+        return changes
+    
+    
+    # Applies every pending edit in one go. If anything's wrong (unknown ids or
+    # pairs, values out of range), nothing is changed. Returns the number of
+    # records that changed.
+    def apply(self):
+        file = open(self.filepath, "r+b")
+        data = mmap.mmap(file.fileno(), 0)
+        try:
+            blocks = bmfile.find_binary_blocks(data)
+            changes = []
+            if self.char_edits:
+                if 4 not in blocks:
+                    raise ValueError("Font has no chars block")
+                found = self.locate(data, blocks[4], CHAR_ENTRY_SIZE, "<I16x", self.char_edits)
+                changes += self.plan(data, found, self.char_edits, CHAR_FIELDS, CHAR_ENTRY_SIZE)
+            if self.kerning_edits:
+                if 5 not in blocks:
+                    raise ValueError("Font has no kernings block")
+                found = self.locate(data, blocks[5], KERNING_ENTRY_SIZE, "<II2x", self.kerning_edits)
+                changes += self.plan(data, found, self.kerning_edits, KERNING_FIELDS, KERNING_ENTRY_SIZE)
+            
+            if changes:
+                write_journal(get_journal_filepath(self.filepath), [(offset, original) for offset, original, x in changes])
+                for offset, original, x in changes:
+                    data[offset:offset + len(x)] = x
+                data.flush()
+                os.remove(get_journal_filepath(self.filepath))
+        finally:
+            data.close()
+            file.close()
+        
+        self.char_edits = {}
+        self.kerning_edits = {}
+        return len(changes)
+    
+    
+    def __init__(self, _filepath):
+        self.filepath = _filepath
+        self.char_edits = {}
+        self.kerning_edits = {}
+        
+        recover(self.filepath)
+
+
+# Shortcut for applying a batch of edits in one call.
+# char_edits is {id: {field: value}}, kerning_edits is {(first, second): amount}.
+def patch_file(filepath, char_edits = None, kerning_edits = None):
+    editor = FontEditor(filepath)
+    for id, fields in (char_edits or {}).items():
+        editor.set_char(id, **fields)
+    for (first, second), amount in (kerning_edits or {}).items():
+        editor.set_kerning(first, second, amount)
+    return editor.apply()
@@ -1,10 +1,17 @@
-import re
 import io
 
 FILE_TYPE_INVALID = -1
 FILE_TYPE_TEXT = 0
 FILE_TYPE_XML = FILE_TYPE_TEXT + 1
 FILE_TYPE_BINARY3 = FILE_TYPE_XML + 1
+FILE_TYPE_JSON = FILE_TYPE_BINARY3 + 1
+FILE_TYPE_JSON_COLUMNS = FILE_TYPE_JSON + 1
+
+# JSON is written without any spaces, to keep files small.
+JSON_SEPARATORS = (",", ":")
+
+# Compiled regular expressions, by pattern (see pattern()).
+PATTERNS = {}
 
 ##########
 # Utility functions
@@ -19,20 +26,43 @@ def check_file_format(filepath):
     x = ""
     try:
         file = open(filepath, "rb")
-        x = file.read(4)
+        x = file.read(32)
+        file.close()
     except:
         return FILE_TYPE_INVALID
     
+    return check_data_format(x)
+
+
+# Same as above, but works on the first few bytes of a file that's already in
+# memory (e.g. an upload that never touched the disk).
+def check_data_format(x):
+    y = bytes(x[0:32])
+    x = y[0:4]
     if x == bytes("info", "utf-8"): # text
         return FILE_TYPE_TEXT
     elif x == bytes("<?xm", "utf-8"): # XML
         return FILE_TYPE_XML
     elif x == bytes([66, 77, 70, 3]): # binary v3
         return FILE_TYPE_BINARY3
+    elif y.startswith(bytes("{", "utf-8")) and bytes("\"format\"", "utf-8") in y: # JSON
+        return FILE_TYPE_JSON_COLUMNS if bytes("\"columns\"", "utf-8") in y else FILE_TYPE_JSON
     else:
         return FILE_TYPE_INVALID
 
 
+# Returns the compiled form of a regular expression. Each pattern is compiled
+# the first time it's used and cached, and re itself is only imported then, so
+# tools that just check the format of a file don't pay for it.
+def pattern(x):
+    p = PATTERNS.get(x)
+    if p is None:
+        import re
+        p = re.compile(x)
+        PATTERNS[x] = p
+    return p
+
+
 # Functions to set and get particular bits.
 def get_bit(i, pos):
     mask = 1 << pos
@@ -44,6 +74,49 @@ def set_bit(i, val, pos):
     return i | mask if val else i & ~mask
 
 
+# Returns whether the file type is one of the JSON layouts.
+def is_json(file_type):
+    return file_type == FILE_TYPE_JSON or file_type == FILE_TYPE_JSON_COLUMNS
+
+
+# Parses a line of JSON written by one of the encoders below, which always put
+# a single value (or "name": value member) on each line.
+def parse_json_line(x):
+    import json
+    x = x.strip().rstrip(",")
+    if x.startswith("\"") and "\":" in x:
+        x = x[x.index("\":") + 2:]
+    return json.loads(x)
+
+
+# Reads the line that should close a block of entries ("  </chars>" in XML,
+# "  ]" in JSON). Returns None if it does, or the line if it's something else,
+# like an entry the block's count left out.
+def skip_closing_line(file):
+    x = file.readline()
+    if pattern(r'^\s*(</|\]|\})').match(x):
+        return None
+    return x
+
+
+# Returns the mode a file of the given type should be opened with.
+def get_read_mode(file_type):
+    return "rb" if file_type == FILE_TYPE_BINARY3 else "r"
+
+
+def get_write_mode(file_type):
+    return "wb" if file_type == FILE_TYPE_BINARY3 else "w"
+
+
+# Opens a .fnt file of any format for reading. Returns the file and its format.
+# Raises ValueError if the file isn't a BMFont file.
+def open_font(filepath):
+    source_file_type = check_file_format(filepath)
+    if source_file_type == FILE_TYPE_INVALID:
+        raise ValueError("{0} is not a valid BMFont .fnt file".format(filepath))
+    return open(filepath, get_read_mode(source_file_type)), source_file_type
+
+
 ##########
 # Header, footer, EOF functions
 ##########
@@ -51,13 +124,13 @@ def set_bit(i, val, pos):
 
 # Returns a suitable header for the file based on the requested file type.
 def get_file_header(file_type):
-    headers = ["", "<?xml version=\"1.0\"?>\n<font>\n", b'BMF\x03']
+    headers = ["", "<?xml version=\"1.0\"?>\n<font>\n", b'BMF\x03', "{\n  \"format\": \"rows\",\n", "{\n  \"format\": \"columns\",\n"]
     return headers[file_type]
 
 
 # Returns a suitable footer for the file based on the requested file type.
 def get_file_footer(file_type):
-    footers = ["", "</font>\n", b'']
+    footers = ["", "</font>\n", b'', "\n}\n", "\n}\n"]
     return footers[file_type]
 
 
@@ -67,17 +140,68 @@ def block_5_exists(file, source_file_type):
     exists = False
     if source_file_type == FILE_TYPE_TEXT:
         x = file.readline()
-        exists = True if re.compile(r'kernings').search(x) else False
+        exists = True if pattern(r'kernings').search(x) else False
     elif source_file_type == FILE_TYPE_XML:
         x = file.readline()
-        exists = True if re.compile(r'kernings').search(x) else False
+        exists = True if pattern(r'kernings').search(x) else False
     elif source_file_type == FILE_TYPE_BINARY3:
         x = file.read(1)
         exists = True if x == bytes([5]) else False
+    elif is_json(source_file_type):
+        x = file.readline()
+        exists = True if pattern(r'kernings').search(x) else False
     file.seek(pos)
     return exists
 
 
+##########
+# Binary v3 blocks
+##########
+
+# Walks the block headers of binary v3 data, and yields (block type, offset of
+# the block's data, size of the block's data) for each block, in order. source
+# is either an open file, of which only the headers are read, or the data
+# itself (bytes, an mmap, or a memoryview). Raises ValueError if it isn't
+# binary v3, or if a block header or a block runs past the end.
+def iter_binary_blocks(source):
+    if hasattr(source, "__getitem__"):
+        size = len(source)
+        def read_at(pos, length):
+            return bytes(source[pos:pos + length])
+    else:
+        source.seek(0, io.SEEK_END)
+        size = source.tell()
+        def read_at(pos, length):
+            source.seek(pos)
+            return source.read(length)
+    
+    header = get_file_header(FILE_TYPE_BINARY3)
+    if read_at(0, len(header)) != header:
+        raise ValueError("Not a binary v3 BMFont file")
+    
+    pos = len(header)
+    while pos < size:
+        x = read_at(pos, 5)
+        if len(x) < 5:
+            raise ValueError("File ends in the middle of a block header")
+        block_type = x[0]
+        block_size = int.from_bytes(x[1:5], "little")
+        pos += 5
+        if pos + block_size > size:
+            raise ValueError("Block {0} is {1} bytes, but only {2} are left in the file".format(block_type, block_size, size - pos))
+        yield block_type, pos, block_size
+        pos += block_size
+
+
+# Returns a dictionary of block type: (offset of the block's data, size of the
+# block's data) for binary v3 data (see iter_binary_blocks()).
+def find_binary_blocks(source):
+    blocks = {}
+    for block_type, offset, size in iter_binary_blocks(source):
+        blocks[block_type] = (offset, size)
+    return blocks
+
+
 ##########
 # Block 1 (info) parsers
 ##########
@@ -85,14 +209,14 @@ def block_5_exists(file, source_file_type):
 # Reads all data from block 1, and returns it in a dictionary.
 # Assumes the file has otherwise not been parsed yet.
 def get_block_1_data(file, source_file_type):
-    functions = [get_block_1_data_txt, get_block_1_data_xml, get_block_1_data_bn3]
+    functions = [get_block_1_data_txt, get_block_1_data_xml, get_block_1_data_bn3, get_block_1_data_json, get_block_1_data_json]
     return functions[source_file_type](file)
 
 
 # Translates all data for block 1 into the file format using a dictionary.
 # Does not automatically write the info into the new file!
 def encode_block_1_data(data, target_file_type):
-    functions = [encode_block_1_data_txt, encode_block_1_data_xml, encode_block_1_data_bn3]
+    functions = [encode_block_1_data_txt, encode_block_1_data_xml, encode_block_1_data_bn3, encode_block_1_data_json, encode_block_1_data_json]
     return functions[target_file_type](data)
 
 
@@ -102,41 +226,41 @@ def get_block_1_data_txt(file):
     x = x.rstrip() + " "
     
     data = {}
-    data["face"] = re.compile(r'face=\"(.*?)\" ').search(x).group(1)
-    data["size"] = int(re.compile(r'size=(.*?) ').search(x).group(1))
-    data["bold"] = int(re.compile(r'bold=(.*?) ').search(x).group(1))
-    data["italic"] = int(re.compile(r'italic=(.*?) ').search(x).group(1))
-    data["charset"] = re.compile(r'charset=\"(.*?)\" ').search(x).group(1)
-    data["unicode"] = int(re.compile(r'unicode=(.*?) ').search(x).group(1))
-    data["stretchH"] = int(re.compile(r'stretchH=(.*?) ').search(x).group(1))
-    data["smooth"] = int(re.compile(r'smooth=(.*?) ').search(x).group(1))
-    data["aa"] = int(re.compile(r'aa=(.*?) ').search(x).group(1))
-    data["padding"] = list(map(lambda x: int(x), re.compile(r'padding=(.*?) ').search(x).group(1).split(',')))
-    data["spacing"] = list(map(lambda x: int(x), re.compile(r'spacing=(.*?) ').search(x).group(1).split(',')))
-    data["outline"] = int(re.compile(r'outline=(.*?) ').search(x).group(1))
+    data["face"] = pattern(r'face=\"(.*?)\" ').search(x).group(1)
+    data["size"] = int(pattern(r'size=(.*?) ').search(x).group(1))
+    data["bold"] = int(pattern(r'bold=(.*?) ').search(x).group(1))
+    data["italic"] = int(pattern(r'italic=(.*?) ').search(x).group(1))
+    data["charset"] = pattern(r'charset=\"(.*?)\" ').search(x).group(1)
+    data["unicode"] = int(pattern(r'unicode=(.*?) ').search(x).group(1))
+    data["stretchH"] = int(pattern(r'stretchH=(.*?) ').search(x).group(1))
+    data["smooth"] = int(pattern(r'smooth=(.*?) ').search(x).group(1))
+    data["aa"] = int(pattern(r'aa=(.*?) ').search(x).group(1))
+    data["padding"] = list(map(lambda x: int(x), pattern(r'padding=(.*?) ').search(x).group(1).split(',')))
+    data["spacing"] = list(map(lambda x: int(x), pattern(r'spacing=(.*?) ').search(x).group(1).split(',')))
+    data["outline"] = int(pattern(r'outline=(.*?) ').search(x).group(1))
     
     return data
 
 
 def get_block_1_data_xml(file):
     x = ""
-    while not re.compile(r'^  <info ').search(x):
+    while not pattern(r'^  <info ').search(x):
         x = file.readline()
     x = x.rstrip("/>\n") + " "
     
     data = {}
-    data["face"] = re.compile(r'face=\"(.*?)\" ').search(x).group(1)
-    data["size"] = int(re.compile(r'size=\"(.*?)\" ').search(x).group(1))
-    data["bold"] = int(re.compile(r'bold=\"(.*?)\" ').search(x).group(1))
-    data["italic"] = int(re.compile(r'italic=\"(.*?)\" ').search(x).group(1))
-    data["charset"] = re.compile(r'charset=\"(.*?)\" ').search(x).group(1)
-    data["unicode"] = int(re.compile(r'unicode=\"(.*?)\" ').search(x).group(1))
-    data["stretchH"] = int(re.compile(r'stretchH=\"(.*?)\" ').search(x).group(1))
-    data["smooth"] = int(re.compile(r'smooth=\"(.*?)\" ').search(x).group(1))
-    data["aa"] = int(re.compile(r'aa=\"(.*?)\" ').search(x).group(1))
-    data["padding"] = list(map(lambda x: int(x), re.compile(r'padding=\"(.*?)\" ').search(x).group(1).split(',')))
-    data["spacing"] = list(map(lambda x: int(x), re.compile(r'spacing=\"(.*?)\" ').search(x).group(1).split(',')))
-    data["outline"] = int(re.compile(r'outline=\"(.*?)\" ').search(x).group(1))
+    data["face"] = pattern(r'face=\"(.*?)\" ').search(x).group(1)
+    data["size"] = int(pattern(r'size=\"(.*?)\" ').search(x).group(1))
+    data["bold"] = int(pattern(r'bold=\"(.*?)\" ').search(x).group(1))
+    data["italic"] = int(pattern(r'italic=\"(.*?)\" ').search(x).group(1))
+    data["charset"] = pattern(r'charset=\"(.*?)\" ').search(x).group(1)
+    data["unicode"] = int(pattern(r'unicode=\"(.*?)\" ').search(x).group(1))
+    data["stretchH"] = int(pattern(r'stretchH=\"(.*?)\" ').search(x).group(1))
+    data["smooth"] = int(pattern(r'smooth=\"(.*?)\" ').search(x).group(1))
+    data["aa"] = int(pattern(r'aa=\"(.*?)\" ').search(x).group(1))
+    data["padding"] = list(map(lambda x: int(x), pattern(r'padding=\"(.*?)\" ').search(x).group(1).split(',')))
+    data["spacing"] = list(map(lambda x: int(x), pattern(r'spacing=\"(.*?)\" ').search(x).group(1).split(',')))
+    data["outline"] = int(pattern(r'outline=\"(.*?)\" ').search(x).group(1))
     
     return data
 
@@ -164,6 +288,13 @@ def get_block_1_data_bn3(file):
     return data
 
 
+def get_block_1_data_json(file):
+    x = ""
+    while not pattern(r'^  "info":').search(x):
+        x = file.readline()
+    return parse_json_line(x)
+
+
 def encode_block_1_data_txt(data):
     x = "info "
     x += "face=\"" + data["face"] + "\" "
@@ -227,6 +358,11 @@ def encode_block_1_data_bn3(data):
     return head + x
 
 
+def encode_block_1_data_json(data):
+    import json
+    return "  \"info\": " + json.dumps(data, separators = JSON_SEPARATORS) + ",\n"
+
+
 ##########
 # Block 2 (common) parsers
 ##########
@@ -234,14 +370,14 @@ def encode_block_1_data_bn3(data):
 # Reads all data from block 2, and returns it in a dictionary.
 # Assumes the file is at the beginning of block 2.
 def get_block_2_data(file, source_file_type):
-    functions = [get_block_2_data_txt, get_block_2_data_xml, get_block_2_data_bn3]
+    functions = [get_block_2_data_txt, get_block_2_data_xml, get_block_2_data_bn3, get_block_2_data_json, get_block_2_data_json]
     return functions[source_file_type](file)
 
 
 # Translates all data for block 2 into the file format using a dictionary.
 # Does not automatically write the info into the new file!
 def encode_block_2_data(data, target_file_type):
-    functions = [encode_block_2_data_txt, encode_block_2_data_xml, encode_block_2_data_bn3]
+    functions = [encode_block_2_data_txt, encode_block_2_data_xml, encode_block_2_data_bn3, encode_block_2_data_json, encode_block_2_data_json]
     return functions[target_file_type](data)
 
 
@@ -251,16 +387,16 @@ def get_block_2_data_txt(file):
     x = x.rstrip() + " "
     
     data = {}
-    data["lineHeight"] = int(re.compile(r'lineHeight=(.*?) ').search(x).group(1))
-    data["base"] = int(re.compile(r'base=(.*?) ').search(x).group(1))
-    data["scaleW"] = int(re.compile(r'scaleW=(.*?) ').search(x).group(1))
-    data["scaleH"] = int(re.compile(r'scaleH=(.*?) ').search(x).group(1))
-    data["pages"] = int(re.compile(r'pages=(.*?) ').search(x).group(1))
-    data["packed"] = int(re.compile(r'packed=(.*?) ').search(x).group(1))
-    data["alphaChnl"] = int(re.compile(r'alphaChnl=(.*?) ').search(x).group(1))
-    data["redChnl"] = int(re.compile(r'redChnl=(.*?) ').search(x).group(1))
-    data["greenChnl"] = int(re.compile(r'greenChnl=(.*?) ').search(x).group(1))
-    data["blueChnl"] = int(re.compile(r'blueChnl=(.*?) ').search(x).group(1))
+    data["lineHeight"] = int(pattern(r'lineHeight=(.*?) ').search(x).group(1))
+    data["base"] = int(pattern(r'base=(.*?) ').search(x).group(1))
+    data["scaleW"] = int(pattern(r'scaleW=(.*?) ').search(x).group(1))
+    data["scaleH"] = int(pattern(r'scaleH=(.*?) ').search(x).group(1))
+    data["pages"] = int(pattern(r'pages=(.*?) ').search(x).group(1))
+    data["packed"] = int(pattern(r'packed=(.*?) ').search(x).group(1))
+    data["alphaChnl"] = int(pattern(r'alphaChnl=(.*?) ').search(x).group(1))
+    data["redChnl"] = int(pattern(r'redChnl=(.*?) ').search(x).group(1))
+    data["greenChnl"] = int(pattern(r'greenChnl=(.*?) ').search(x).group(1))
+    data["blueChnl"] = int(pattern(r'blueChnl=(.*?) ').search(x).group(1))
     
     return data
 
@@ -270,16 +406,16 @@ def get_block_2_data_xml(file):
     x = x.rstrip("/>\n") + " "
     
     data = {}
-    data["lineHeight"] = int(re.compile(r'lineHeight=\"(.*?)\" ').search(x).group(1))
-    data["base"] = int(re.compile(r'base=\"(.*?)\" ').search(x).group(1))
-    data["scaleW"] = int(re.compile(r'scaleW=\"(.*?)\" ').search(x).group(1))
-    data["scaleH"] = int(re.compile(r'scaleH=\"(.*?)\" ').search(x).group(1))
-    data["pages"] = int(re.compile(r'pages=\"(.*?)\" ').search(x).group(1))
-    data["packed"] = int(re.compile(r'packed=\"(.*?)\" ').search(x).group(1))
-    data["alphaChnl"] = int(re.compile(r'alphaChnl=\"(.*?)\" ').search(x).group(1))
-    data["redChnl"] = int(re.compile(r'redChnl=\"(.*?)\" ').search(x).group(1))
-    data["greenChnl"] = int(re.compile(r'greenChnl=\"(.*?)\" ').search(x).group(1))
-    data["blueChnl"] = int(re.compile(r'blueChnl=\"(.*?)\" ').search(x).group(1))
+    data["lineHeight"] = int(pattern(r'lineHeight=\"(.*?)\" ').search(x).group(1))
+    data["base"] = int(pattern(r'base=\"(.*?)\" ').search(x).group(1))
+    data["scaleW"] = int(pattern(r'scaleW=\"(.*?)\" ').search(x).group(1))
+    data["scaleH"] = int(pattern(r'scaleH=\"(.*?)\" ').search(x).group(1))
+    data["pages"] = int(pattern(r'pages=\"(.*?)\" ').search(x).group(1))
+    data["packed"] = int(pattern(r'packed=\"(.*?)\" ').search(x).group(1))
+    data["alphaChnl"] = int(pattern(r'alphaChnl=\"(.*?)\" ').search(x).group(1))
+    data["redChnl"] = int(pattern(r'redChnl=\"(.*?)\" ').search(x).group(1))
+    data["greenChnl"] = int(pattern(r'greenChnl=\"(.*?)\" ').search(x).group(1))
+    data["blueChnl"] = int(pattern(r'blueChnl=\"(.*?)\" ').search(x).group(1))
     
     return data
 
@@ -305,6 +441,11 @@ def get_block_2_data_bn3(file):
     return data
 
 
+def get_block_2_data_json(file):
+    x = file.readline()
+    return parse_json_line(x)
+
+
 def encode_block_2_data_txt(data):
     x = "common "
     x += "lineHeight=" + str(data["lineHeight"]) + " "
@@ -358,6 +499,78 @@ def encode_block_2_data_bn3(data):
     return head + x
 
 
+def encode_block_2_data_json(data):
+    import json
+    return "  \"common\": " + json.dumps(data, separators = JSON_SEPARATORS) + ",\n"
+
+
+##########
+# Page ranges
+##########
+
+# A page range table has one (start, count) pair per page, describing which
+# slice of block 4 holds that page's chars. It only makes sense for fonts whose
+# chars are grouped by page (see group_chars_by_page()).
+PAGE_RANGES_MAGIC = b'BMFP'
+PAGE_RANGES_EXTENSION = ".pages"
+
+
+# Stably sorts a list of block 4 dictionaries by page, then id, and returns the
+# page range table for the result.
+def group_chars_by_page(entries, page_count):
+    entries.sort(key = lambda data: (data["page"], data["id"]))
+    
+    page_count = max([page_count] + [data["page"] + 1 for data in entries])
+    counts = [0] * page_count
+    for data in entries:
+        counts[data["page"]] += 1
+    
+    page_ranges = []
+    start = 0
+    for count in counts:
+        page_ranges.append((start, count))
+        start += count
+    return page_ranges
+
+
+# Text and XML store the table as a flat list: "start0,count0,start1,count1,..."
+def encode_page_ranges(page_ranges):
+    return ",".join([str(start) + "," + str(count) for start, count in page_ranges])
+
+
+def decode_page_ranges(x):
+    x = list(map(lambda x: int(x), x.split(",")))
+    return [(x[i], x[i + 1]) for i in range(0, len(x) - 1, 2)]
+
+
+# The binary format has nowhere to put the table, so it goes in a sidecar file:
+# magic, u32 page count, then u32 start and u32 count for each page.
+def save_page_ranges(filepath, page_ranges):
+    x = bytearray(PAGE_RANGES_MAGIC)
+    x += len(page_ranges).to_bytes(4, "little")
+    for start, count in page_ranges:
+        x += start.to_bytes(4, "little") + count.to_bytes(4, "little")
+    
+    file = open(filepath, "wb")
+    file.write(x)
+    file.close()
+
+
+def load_page_ranges(filepath):
+    file = open(filepath, "rb")
+    x = file.read()
+    file.close()
+    
+    if x[0:4] != PAGE_RANGES_MAGIC:
+        raise ValueError("Not a page range file")
+    page_count = int.from_bytes(x[4:8], "little")
+    page_ranges = []
+    for i in range(page_count):
+        pos = 8 + i * 8
+        page_ranges.append((int.from_bytes(x[pos:pos + 4], "little"), int.from_bytes(x[pos + 4:pos + 8], "little")))
+    return page_ranges
+
+
 ##########
 # Block 3 (pages) iterator
 ##########
@@ -368,25 +581,29 @@ class Block3Iterator:
     def get_block_3_metadata(self, file):
         data = {}
         
-        if self.source_file_type == FILE_TYPE_TEXT:
-            pos = file.tell()
-            x = file.readline().rstrip() + " "
-            texture_name = re.compile(r'file=\"(.*?)\" ').search(x).group(1)
-            data["block_size"] = len(texture_name) + 1 # +1 is the b'\x00' at the end of the string
-            file.seek(pos)
-        elif self.source_file_type == FILE_TYPE_XML:
-            file.readline() # Skips over the "  <pages>" opening tag
-            pos = file.tell()
-            x = file.readline().rstrip("/>\n") + " "
-            texture_name = re.compile(r'file=\"(.*?)\" ').search(x).group(1)
-            data["block_size"] = len(texture_name) + 1 # +1 is the b'\x00' at the end of the string
-            file.seek(pos)
-        elif self.source_file_type == FILE_TYPE_BINARY3:
+        if self.source_file_type == FILE_TYPE_BINARY3:
             file.seek(1, io.SEEK_CUR) # Skips over the "block 3" byte
             size = file.read(4)
             size = int.from_bytes(size, byteorder = "little")
             data["block_size"] = size
-        data["entry_size"] = int(data["block_size"] / self.limit)
+            data["entry_size"] = size // self.limit if self.limit > 0 else 0
+            return data
+        
+        if self.source_file_type == FILE_TYPE_XML or is_json(self.source_file_type):
+            file.readline() # Skips over the "  <pages>" opening tag (or "  \"pages\": [" in JSON)
+        
+        # In binary, every name is padded to the length of the longest one, so
+        # all the names have to be read to know the block size
+        pos = file.tell()
+        functions = [self.get_block_3_data_txt, self.get_block_3_data_xml, None, self.get_block_3_data_json, self.get_block_3_data_json]
+        entry_size = 0
+        for i in range(self.limit):
+            texture_name = functions[self.source_file_type](file)["file"]
+            entry_size = max(entry_size, len(bytes(texture_name, "utf-8")) + 1) # +1 is the b'\x00' at the end of the string
+        file.seek(pos)
+        
+        data["entry_size"] = entry_size
+        data["block_size"] = entry_size * self.limit
         return data
     
     
@@ -398,6 +615,8 @@ class Block3Iterator:
             return "  <pages>\n"
         if self.target_file_type == FILE_TYPE_BINARY3:
             return bytearray([3]) + self.metadata["block_size"].to_bytes(4, "little")
+        if is_json(self.target_file_type):
+            return "  \"pages\": [\n"
     
     
     # Returns the text or bytes that should go behind the last entry
@@ -408,19 +627,23 @@ class Block3Iterator:
             return "  </pages>\n"
         if self.target_file_type == FILE_TYPE_BINARY3:
             return bytearray()
+        if is_json(self.target_file_type):
+            return "  ],\n"
     
     
     # Reads a line (or entry) of data from block 3, and returns it in a dictionary.
     # Assumes the file is at the beginning of block 3.
     def get_block_3_data(self, file):
-        functions = [self.get_block_3_data_txt, self.get_block_3_data_xml, self.get_block_3_data_bn3]
+        if self.entries is not None:
+            return self.entries[self.index]
+        functions = [self.get_block_3_data_txt, self.get_block_3_data_xml, self.get_block_3_data_bn3, self.get_block_3_data_json, self.get_block_3_data_json]
         return functions[self.source_file_type](file)
     
     
     # Translates a line (or entry) of data for block 3 into the file format using a dictionary.
     # Does not automatically write the info into the new file!
     def encode_block_3_data(self, data):
-        functions = [self.encode_block_3_data_txt, self.encode_block_3_data_xml, self.encode_block_3_data_bn3]
+        functions = [self.encode_block_3_data_txt, self.encode_block_3_data_xml, self.encode_block_3_data_bn3, self.encode_block_3_data_json, self.encode_block_3_data_json]
         return functions[self.target_file_type](data)
     
     
@@ -430,7 +653,7 @@ class Block3Iterator:
         x = x.rstrip() + " "
         
         data = {}
-        data["file"] = re.compile(r'file=\"(.*?)\" ').search(x).group(1)
+        data["file"] = pattern(r'file=\"(.*?)\" ').search(x).group(1)
         
         return data
     
@@ -440,7 +663,7 @@ class Block3Iterator:
         x = x.rstrip("/>\n") + " "
         
         data = {}
-        data["file"] = re.compile(r'file=\"(.*?)\" ').search(x).group(1)
+        data["file"] = pattern(r'file=\"(.*?)\" ').search(x).group(1)
         
         return data
     
@@ -454,6 +677,13 @@ class Block3Iterator:
         return data
     
     
+    def get_block_3_data_json(self, file):
+        data = {}
+        data["file"] = parse_json_line(file.readline())
+        
+        return data
+    
+    
     def encode_block_3_data_txt(self, data):
         x = "page "
         x += "id=" + str(data["id"]) + " "
@@ -473,18 +703,52 @@ class Block3Iterator:
     def encode_block_3_data_bn3(self, data):
         x = bytearray()
         x += bytes(data["file"], "utf-8") + bytes([0])              # file
+        x += bytes(max(0, self.metadata["entry_size"] - len(x)))    # padding, if other names are longer
+        
+        return x
+    
+    
+    def encode_block_3_data_json(self, data):
+        import json
+        x = "    " + json.dumps(data["file"])
+        x += ",\n" if self.index < self.limit - 1 else "\n"
         
         return x
     
     
-    def __init__(self, _file, _source_file_type, _target_file_type, _page_count):
+    # Reads all remaining entries into a list of dictionaries, without encoding
+    # anything. Leaves the file at the end of block 3, like iterating would.
+    def read_entries(self):
+        entries = []
+        while self.index < self.limit:
+            data = self.get_block_3_data(self.file)
+            data["id"] = self.index
+            entries.append(data)
+            self.index += 1
+        if (self.source_file_type == FILE_TYPE_XML or is_json(self.source_file_type)) and self.limit > 0:
+            self.unexpected_line = skip_closing_line(self.file) # Skips over the "  </pages>" closing tag (or "  ]," in JSON)
+        return entries
+    
+    
+    # If _entries (a list of dictionaries) is given, those get encoded instead
+    # of entries read from the file, and the file isn't touched at all. Names
+    # don't have to be the same length; in binary, shorter ones get padded.
+    def __init__(self, _file, _source_file_type, _target_file_type, _page_count, _entries = None):
         self.file = _file
         self.source_file_type = _source_file_type
         self.target_file_type = _target_file_type
         self.index = 0
         self.limit = _page_count
+        self.entries = _entries
+        self.unexpected_line = None # set if the line after the last entry doesn't close the block
         
-        self.metadata = self.get_block_3_metadata(self.file)
+        if self.entries is None:
+            self.metadata = self.get_block_3_metadata(self.file)
+        else:
+            self.source_file_type = FILE_TYPE_INVALID
+            self.limit = len(self.entries)
+            entry_size = max([len(bytes(x["file"], "utf-8")) + 1 for x in self.entries] + [0])
+            self.metadata = {"block_size": entry_size * self.limit, "entry_size": entry_size}
     
     
     def __iter__(self):
@@ -499,9 +763,9 @@ class Block3Iterator:
             
             if self.index == 0:
                 x = self.get_fragment_header() + x
-            elif self.index == self.limit - 1:
-                if self.source_file_type == FILE_TYPE_XML:
-                    self.file.readline() # Skips over the "  </pages>" closing tag
+            if self.index == self.limit - 1:
+                if self.source_file_type == FILE_TYPE_XML or is_json(self.source_file_type):
+                    self.unexpected_line = skip_closing_line(self.file) # Skips over the "  </pages>" closing tag (or "  ]," in JSON)
                 x = x + self.get_fragment_footer()
             
             self.index += 1
@@ -524,26 +788,60 @@ class Block4Iterator:
         
         if self.source_file_type == FILE_TYPE_TEXT:
             x = file.readline().rstrip() + " "
-            data["count"] = int(re.compile(r'count=(.*?) ').search(x).group(1))
+            data["count"] = int(pattern(r'count=(.*?) ').search(x).group(1))
+            y = pattern(r'pageRanges=(.*?) ').search(x)
+            if y:
+                data["page_ranges"] = decode_page_ranges(y.group(1))
         elif self.source_file_type == FILE_TYPE_XML:
             x = file.readline().rstrip("/>\n") + " "
-            data["count"] = int(re.compile(r'count=\"(.*?)\" ').search(x).group(1))
+            data["count"] = int(pattern(r'count=\"(.*?)\" ').search(x).group(1))
+            y = pattern(r'pageRanges=\"(.*?)\" ').search(x)
+            if y:
+                data["page_ranges"] = decode_page_ranges(y.group(1))
         elif self.source_file_type == FILE_TYPE_BINARY3:
             file.seek(1, io.SEEK_CUR) # Skips over the "block 4" byte
             size = file.read(4)
             size = int.from_bytes(size, byteorder = "little")
             data["count"] = int(size / Block4Iterator.BLOCK_4_BINARY3_ENTRY_SIZE)
+        elif is_json(self.source_file_type):
+            x = file.readline()
+            while not pattern(r'^  "chars":').search(x): # Stops at the "  \"chars\": [" opening line
+                if pattern(r'^  "charsCount":').search(x):
+                    data["count"] = parse_json_line(x)
+                elif pattern(r'^  "pageRanges":').search(x):
+                    data["page_ranges"] = [tuple(y) for y in parse_json_line(x)]
+                x = file.readline()
+        if self.source_file_type == FILE_TYPE_JSON_COLUMNS:
+            data["columns"] = {}
+            x = file.readline()
+            while x.strip() not in ["}", "},"]:
+                key = x.strip().split("\"")[1]
+                data["columns"][key] = parse_json_line(x)
+                x = file.readline()
         return data
     
     
     # Returns the text or bytes that should go in front of the first entry
     def get_fragment_header(self):
+        page_ranges = self.metadata.get("page_ranges")
         if self.target_file_type == FILE_TYPE_TEXT:
-            return "chars count=" + str(self.metadata["count"]) + "\n"
+            x = "chars count=" + str(self.metadata["count"])
+            if page_ranges is not None:
+                x += " pageRanges=" + encode_page_ranges(page_ranges)
+            return x + "\n"
         if self.target_file_type == FILE_TYPE_XML:
-            return "  <chars count=\"" + str(self.metadata["count"]) + "\">\n"
+            x = "  <chars count=\"" + str(self.metadata["count"]) + "\""
+            if page_ranges is not None:
+                x += " pageRanges=\"" + encode_page_ranges(page_ranges) + "\""
+            return x + ">\n"
         if self.target_file_type == FILE_TYPE_BINARY3:
-            return bytearray([4]) + self.metadata["count"].to_bytes(4, "little")
+            return bytearray([4]) + (self.metadata["count"] * Block4Iterator.BLOCK_4_BINARY3_ENTRY_SIZE).to_bytes(4, "little")
+        if is_json(self.target_file_type):
+            x = "  \"charsCount\": " + str(self.metadata["count"]) + ",\n"
+            if page_ranges is not None:
+                import json
+                x += "  \"pageRanges\": " + json.dumps(page_ranges, separators = JSON_SEPARATORS) + ",\n"
+            return x + ("  \"chars\": [\n" if self.target_file_type == FILE_TYPE_JSON else "  \"chars\": {\n")
     
     
     # Returns the text or bytes that should go behind the last entry
@@ -554,19 +852,29 @@ class Block4Iterator:
             return "  </chars>\n"
         if self.target_file_type == FILE_TYPE_BINARY3:
             return bytearray()
+        if self.target_file_type == FILE_TYPE_JSON:
+            return "  ]"
+        if self.target_file_type == FILE_TYPE_JSON_COLUMNS:
+            import json
+            x = []
+            for key, values in self.columns.items():
+                x.append("    " + json.dumps(key) + ":" + json.dumps(values, separators = JSON_SEPARATORS))
+            return ",\n".join(x) + "\n  }"
     
     
     # Reads a line (or entry) of data from block 4, and returns it in a dictionary.
     # Assumes the file is at the beginning of block 4.
     def get_block_4_data(self, file):
-        functions = [self.get_block_4_data_txt, self.get_block_4_data_xml, self.get_block_4_data_bn3]
+        if self.entries is not None:
+            return self.entries[self.index]
+        functions = [self.get_block_4_data_txt, self.get_block_4_data_xml, self.get_block_4_data_bn3, self.get_block_4_data_json, self.get_block_4_data_jsc]
         return functions[self.source_file_type](file)
     
     
     # Translates a line (or entry) of data for block 4 into the file format using a dictionary.
     # Does not automatically write the info into the new file!
     def encode_block_4_data(self, data):
-        functions = [self.encode_block_4_data_txt, self.encode_block_4_data_xml, self.encode_block_4_data_bn3]
+        functions = [self.encode_block_4_data_txt, self.encode_block_4_data_xml, self.encode_block_4_data_bn3, self.encode_block_4_data_json, self.encode_block_4_data_jsc]
         return functions[self.target_file_type](data)
     
     
@@ -576,16 +884,16 @@ class Block4Iterator:
         x = x.rstrip() + " "
         
         data = {}
-        data["id"] = int(re.compile(r'id=(.*?) ').search(x).group(1))
-        data["x"] = int(re.compile(r'x=(.*?) ').search(x).group(1))
-        data["y"] = int(re.compile(r'y=(.*?) ').search(x).group(1))
-        data["width"] = int(re.compile(r'width=(.*?) ').search(x).group(1))
-        data["height"] = int(re.compile(r'height=(.*?) ').search(x).group(1))
-        data["xoffset"] = int(re.compile(r'xoffset=(.*?) ').search(x).group(1))
-        data["yoffset"] = int(re.compile(r'yoffset=(.*?) ').search(x).group(1))
-        data["xadvance"] = int(re.compile(r'xadvance=(.*?) ').search(x).group(1))
-        data["page"] = int(re.compile(r'page=(.*?) ').search(x).group(1))
-        data["chnl"] = int(re.compile(r'chnl=(.*?) ').search(x).group(1))
+        data["id"] = int(pattern(r'id=(.*?) ').search(x).group(1))
+        data["x"] = int(pattern(r'x=(.*?) ').search(x).group(1))
+        data["y"] = int(pattern(r'y=(.*?) ').search(x).group(1))
+        data["width"] = int(pattern(r'width=(.*?) ').search(x).group(1))
+        data["height"] = int(pattern(r'height=(.*?) ').search(x).group(1))
+        data["xoffset"] = int(pattern(r'xoffset=(.*?) ').search(x).group(1))
+        data["yoffset"] = int(pattern(r'yoffset=(.*?) ').search(x).group(1))
+        data["xadvance"] = int(pattern(r'xadvance=(.*?) ').search(x).group(1))
+        data["page"] = int(pattern(r'page=(.*?) ').search(x).group(1))
+        data["chnl"] = int(pattern(r'chnl=(.*?) ').search(x).group(1))
         
         return data
     
@@ -595,16 +903,16 @@ class Block4Iterator:
         x = x.rstrip("/>\n") + " "
         
         data = {}
-        data["id"] = int(re.compile(r'id=\"(.*?)\" ').search(x).group(1))
-        data["x"] = int(re.compile(r'x=\"(.*?)\" ').search(x).group(1))
-        data["y"] = int(re.compile(r'y=\"(.*?)\" ').search(x).group(1))
-        data["width"] = int(re.compile(r'width=\"(.*?)\" ').search(x).group(1))
-        data["height"] = int(re.compile(r'height=\"(.*?)\" ').search(x).group(1))
-        data["xoffset"] = int(re.compile(r'xoffset=\"(.*?)\" ').search(x).group(1))
-        data["yoffset"] = int(re.compile(r'yoffset=\"(.*?)\" ').search(x).group(1))
-        data["xadvance"] = int(re.compile(r'xadvance=\"(.*?)\" ').search(x).group(1))
-        data["page"] = int(re.compile(r'page=\"(.*?)\" ').search(x).group(1))
-        data["chnl"] = int(re.compile(r'chnl=\"(.*?)\" ').search(x).group(1))
+        data["id"] = int(pattern(r'id=\"(.*?)\" ').search(x).group(1))
+        data["x"] = int(pattern(r'x=\"(.*?)\" ').search(x).group(1))
+        data["y"] = int(pattern(r'y=\"(.*?)\" ').search(x).group(1))
+        data["width"] = int(pattern(r'width=\"(.*?)\" ').search(x).group(1))
+        data["height"] = int(pattern(r'height=\"(.*?)\" ').search(x).group(1))
+        data["xoffset"] = int(pattern(r'xoffset=\"(.*?)\" ').search(x).group(1))
+        data["yoffset"] = int(pattern(r'yoffset=\"(.*?)\" ').search(x).group(1))
+        data["xadvance"] = int(pattern(r'xadvance=\"(.*?)\" ').search(x).group(1))
+        data["page"] = int(pattern(r'page=\"(.*?)\" ').search(x).group(1))
+        data["chnl"] = int(pattern(r'chnl=\"(.*?)\" ').search(x).group(1))
         
         return data
     
@@ -627,6 +935,19 @@ class Block4Iterator:
         return data
     
     
+    def get_block_4_data_json(self, file):
+        return parse_json_line(file.readline())
+    
+    
+    # Columns were all read along with the metadata; this just picks one row.
+    def get_block_4_data_jsc(self, file):
+        data = {}
+        for key, values in self.metadata["columns"].items():
+            data[key] = values[self.index]
+        
+        return data
+    
+    
     def encode_block_4_data_txt(self, data):
         x = ""
         
@@ -698,20 +1019,61 @@ class Block4Iterator:
         x += data["xoffset"].to_bytes(2, "little", signed = True)   # xoffset
         x += data["yoffset"].to_bytes(2, "little", signed = True)   # yoffset
         x += data["xadvance"].to_bytes(2, "little", signed = True)  # xadvance
-        x += data["page"].to_bytes(2, "little")                     # page
-        x += data["chnl"].to_bytes(2, "little")                     # chnl
+        x += data["page"].to_bytes(1, "little")                     # page
+        x += data["chnl"].to_bytes(1, "little")                     # chnl
+        
+        return x
+    
+    
+    def encode_block_4_data_json(self, data):
+        import json
+        x = "    " + json.dumps(data, separators = JSON_SEPARATORS)
+        x += ",\n" if self.index < self.limit - 1 else "\n"
         
         return x
     
     
-    def __init__(self, _file, _source_file_type, _target_file_type):
+    # Values are collected per field, and only written out by the footer.
+    def encode_block_4_data_jsc(self, data):
+        for key in ["id", "x", "y", "width", "height", "xoffset", "yoffset", "xadvance", "page", "chnl"]:
+            self.columns.setdefault(key, []).append(data[key])
+        
+        return ""
+    
+    
+    # Reads all remaining entries into a list of dictionaries, without encoding
+    # anything. Leaves the file at the end of block 4, like iterating would.
+    def read_entries(self):
+        entries = []
+        while self.index < self.limit:
+            entries.append(self.get_block_4_data(self.file))
+            self.index += 1
+        if (self.source_file_type == FILE_TYPE_XML or self.source_file_type == FILE_TYPE_JSON) and self.limit > 0:
+            self.unexpected_line = skip_closing_line(self.file) # Skips over the "  </chars>" closing tag (or "  ]" in JSON)
+        return entries
+    
+    
+    # If _entries (a list of dictionaries) is given, those get encoded instead
+    # of entries read from the file, and the file isn't touched at all.
+    def __init__(self, _file, _source_file_type, _target_file_type, _entries = None):
         self.file = _file
         self.source_file_type = _source_file_type
         self.target_file_type = _target_file_type
         self.index = 0
         self.limit = 0
+        self.entries = _entries
+        self.unexpected_line = None # set if the line after the last entry doesn't close the block
+        
+        # Functions that get called with each entry's dictionary as it's read.
+        self.listeners = []
         
-        self.metadata = self.get_block_4_metadata(self.file)
+        self.columns = {} # only used when writing FILE_TYPE_JSON_COLUMNS
+        
+        if self.entries is None:
+            self.metadata = self.get_block_4_metadata(self.file)
+        else:
+            self.source_file_type = FILE_TYPE_INVALID
+            self.metadata = {"count": len(self.entries)}
         self.limit = self.metadata["count"]
     
     
@@ -722,13 +1084,15 @@ class Block4Iterator:
     def __next__(self):
         if self.index < self.limit:
             data = self.get_block_4_data(self.file)
+            for f in self.listeners:
+                f(data)
             x = self.encode_block_4_data(data)
             
             if self.index == 0:
                 x = self.get_fragment_header() + x
-            elif self.index == self.limit - 1:
-                if self.source_file_type == FILE_TYPE_XML:
-                    self.file.readline() # Skips over the "  </chars>" closing tag
+            if self.index == self.limit - 1:
+                if self.source_file_type == FILE_TYPE_XML or self.source_file_type == FILE_TYPE_JSON:
+                    self.unexpected_line = skip_closing_line(self.file) # Skips over the "  </chars>" closing tag (or "  ]" in JSON)
                 x = x + self.get_fragment_footer()
             
             self.index += 1
@@ -751,15 +1115,27 @@ class Block5Iterator:
         
         if self.source_file_type == FILE_TYPE_TEXT:
             x = file.readline().rstrip() + " "
-            data["count"] = int(re.compile(r'count=(.*?) ').search(x).group(1))
+            data["count"] = int(pattern(r'count=(.*?) ').search(x).group(1))
         elif self.source_file_type == FILE_TYPE_XML:
             x = file.readline().rstrip("/>\n") + " "
-            data["count"] = int(re.compile(r'count=\"(.*?)\" ').search(x).group(1))
+            data["count"] = int(pattern(r'count=\"(.*?)\" ').search(x).group(1))
         elif self.source_file_type == FILE_TYPE_BINARY3:
             file.seek(1, io.SEEK_CUR) # Skips over the "block 5" byte
             size = file.read(4)
             size = int.from_bytes(size, byteorder = "little")
             data["count"] = int(size / Block5Iterator.BLOCK_5_BINARY3_ENTRY_SIZE)
+        elif self.source_file_type == FILE_TYPE_JSON:
+            data["count"] = parse_json_line(file.readline())
+            file.readline() # Skips over the "  \"kernings\": [" opening line
+        elif self.source_file_type == FILE_TYPE_JSON_COLUMNS:
+            data["count"] = parse_json_line(file.readline())
+            file.readline() # Skips over the "  \"kernings\": {" opening line
+            data["columns"] = {}
+            x = file.readline()
+            while x.strip() not in ["}", "},"]:
+                key = x.strip().split("\"")[1]
+                data["columns"][key] = parse_json_line(x)
+                x = file.readline()
         return data
     
     
@@ -770,7 +1146,11 @@ class Block5Iterator:
         if self.target_file_type == FILE_TYPE_XML:
             return "  <kernings count=\"" + str(self.metadata["count"]) + "\">\n"
         if self.target_file_type == FILE_TYPE_BINARY3:
-            return bytearray([5]) + self.metadata["count"].to_bytes(4, "little")
+            return bytearray([5]) + (self.metadata["count"] * Block5Iterator.BLOCK_5_BINARY3_ENTRY_SIZE).to_bytes(4, "little")
+        if self.target_file_type == FILE_TYPE_JSON:
+            return ",\n  \"kerningsCount\": " + str(self.metadata["count"]) + ",\n  \"kernings\": [\n"
+        if self.target_file_type == FILE_TYPE_JSON_COLUMNS:
+            return ",\n  \"kerningsCount\": " + str(self.metadata["count"]) + ",\n  \"kernings\": {\n"
     
     
     # Returns the text or bytes that should go behind the last entry
@@ -781,19 +1161,29 @@ class Block5Iterator:
             return "  </kernings>\n"
         if self.target_file_type == FILE_TYPE_BINARY3:
             return bytearray()
+        if self.target_file_type == FILE_TYPE_JSON:
+            return "  ]"
+        if self.target_file_type == FILE_TYPE_JSON_COLUMNS:
+            import json
+            x = []
+            for key, values in self.columns.items():
+                x.append("    " + json.dumps(key) + ":" + json.dumps(values, separators = JSON_SEPARATORS))
+            return ",\n".join(x) + "\n  }"
     
     
     # Reads a line (or entry) of data from block 4, and returns it in a dictionary.
     # Assumes the file is at the beginning of block 4.
     def get_block_5_data(self, file):
-        functions = [self.get_block_5_data_txt, self.get_block_5_data_xml, self.get_block_5_data_bn3]
+        if self.entries is not None:
+            return self.entries[self.index]
+        functions = [self.get_block_5_data_txt, self.get_block_5_data_xml, self.get_block_5_data_bn3, self.get_block_5_data_json, self.get_block_5_data_jsc]
         return functions[self.source_file_type](file)
     
     
     # Translates a line (or entry) of data for block 4 into the file format using a dictionary.
     # Does not automatically write the info into the new file!
     def encode_block_5_data(self, data):
-        functions = [self.encode_block_5_data_txt, self.encode_block_5_data_xml, self.encode_block_5_data_bn3]
+        functions = [self.encode_block_5_data_txt, self.encode_block_5_data_xml, self.encode_block_5_data_bn3, self.encode_block_5_data_json, self.encode_block_5_data_jsc]
         return functions[self.target_file_type](data)
     
     
@@ -803,9 +1193,9 @@ class Block5Iterator:
         x = x.rstrip() + " "
         
         data = {}
-        data["first"] = int(re.compile(r'first=(.*?) ').search(x).group(1))
-        data["second"] = int(re.compile(r'second=(.*?) ').search(x).group(1))
-        data["amount"] = int(re.compile(r'amount=(.*?) ').search(x).group(1))
+        data["first"] = int(pattern(r'first=(.*?) ').search(x).group(1))
+        data["second"] = int(pattern(r'second=(.*?) ').search(x).group(1))
+        data["amount"] = int(pattern(r'amount=(.*?) ').search(x).group(1))
         
         return data
     
@@ -815,9 +1205,9 @@ class Block5Iterator:
         x = x.rstrip("/>\n") + " "
         
         data = {}
-        data["first"] = int(re.compile(r'first=\"(.*?)\" ').search(x).group(1))
-        data["second"] = int(re.compile(r'second=\"(.*?)\" ').search(x).group(1))
-        data["amount"] = int(re.compile(r'amount=\"(.*?)\" ').search(x).group(1))
+        data["first"] = int(pattern(r'first=\"(.*?)\" ').search(x).group(1))
+        data["second"] = int(pattern(r'second=\"(.*?)\" ').search(x).group(1))
+        data["amount"] = int(pattern(r'amount=\"(.*?)\" ').search(x).group(1))
         
         return data
     
@@ -833,6 +1223,19 @@ class Block5Iterator:
         return data
     
     
+    def get_block_5_data_json(self, file):
+        return parse_json_line(file.readline())
+    
+    
+    # Columns were all read along with the metadata; this just picks one row.
+    def get_block_5_data_jsc(self, file):
+        data = {}
+        for key, values in self.metadata["columns"].items():
+            data[key] = values[self.index]
+        
+        return data
+    
+    
     def encode_block_5_data_txt(self, data):
         x = ""
         
@@ -870,14 +1273,54 @@ class Block5Iterator:
         return x
     
     
-    def __init__(self, _file, _source_file_type, _target_file_type):
+    def encode_block_5_data_json(self, data):
+        import json
+        x = "    " + json.dumps(data, separators = JSON_SEPARATORS)
+        x += ",\n" if self.index < self.limit - 1 else "\n"
+        
+        return x
+    
+    
+    # Values are collected per field, and only written out by the footer.
+    def encode_block_5_data_jsc(self, data):
+        for key in ["first", "second", "amount"]:
+            self.columns.setdefault(key, []).append(data[key])
+        
+        return ""
+    
+    
+    # Reads all remaining entries into a list of dictionaries, without encoding
+    # anything. Leaves the file at the end of block 5, like iterating would.
+    def read_entries(self):
+        entries = []
+        while self.index < self.limit:
+            entries.append(self.get_block_5_data(self.file))
+            self.index += 1
+        if (self.source_file_type == FILE_TYPE_XML or self.source_file_type == FILE_TYPE_JSON) and self.limit > 0:
+            self.unexpected_line = skip_closing_line(self.file) # Skips over the "  </kernings>" closing tag (or "  ]" in JSON)
+        return entries
+    
+    
+    # If _entries (a list of dictionaries) is given, those get encoded instead
+    # of entries read from the file, and the file isn't touched at all.
+    def __init__(self, _file, _source_file_type, _target_file_type, _entries = None):
         self.file = _file
         self.source_file_type = _source_file_type
         self.target_file_type = _target_file_type
         self.index = 0
         self.limit = 0
+        self.entries = _entries
+        self.unexpected_line = None # set if the line after the last entry doesn't close the block
+        self.columns = {} # only used when writing FILE_TYPE_JSON_COLUMNS
+        
+        # Functions that get called with each entry's dictionary as it's read.
+        self.listeners = []
         
-        self.metadata = self.get_block_5_metadata(self.file)
+        if self.entries is None:
+            self.metadata = self.get_block_5_metadata(self.file)
+        else:
+            self.source_file_type = FILE_TYPE_INVALID
+            self.metadata = {"count": len(self.entries)}
         self.limit = self.metadata["count"]
     
     
@@ -888,16 +1331,176 @@ class Block5Iterator:
     def __next__(self):
         if self.index < self.limit:
             data = self.get_block_5_data(self.file)
+            for f in self.listeners:
+                f(data)
             x = self.encode_block_5_data(data)
             
             if self.index == 0:
                 x = self.get_fragment_header() + x
-            elif self.index == self.limit - 1:
-                if self.source_file_type == FILE_TYPE_XML:
-                    self.file.readline() # Skips over the "  </kernings>" closing tag
+            if self.index == self.limit - 1:
+                if self.source_file_type == FILE_TYPE_XML or self.source_file_type == FILE_TYPE_JSON:
+                    self.unexpected_line = skip_closing_line(self.file) # Skips over the "  </kernings>" closing tag (or "  ]" in JSON)
                 x = x + self.get_fragment_footer()
             
             self.index += 1
             return x
         else:
             raise StopIteration
+
+
+##########
+# Whole-file reading
+##########
+
+# Reads a whole font, without converting it, and returns a dictionary with
+# "info", "common", "pages", "chars", and "kernings" keys, each in the form the
+# iterators use. Assumes the file has not been parsed yet.
+# listeners get called like they do in convert_blocks() (except on_block, since
+# nothing is written), so tools that only look at the data can share them.
+# Entries past a block's count are never read. If the line after a block's
+# last entry isn't what should come next, listeners also get
+# on_unexpected_line(block_type, line), so checkers can report it.
+def read_font(file, source_file_type, listeners = ()):
+    font = {}
+    font["info"] = get_block_1_data(file, source_file_type)
+    notify_listeners(listeners, "on_info", font["info"])
+    
+    font["common"] = get_block_2_data(file, source_file_type)
+    notify_listeners(listeners, "on_common", font["common"])
+    
+    b3 = Block3Iterator(file, source_file_type, source_file_type, font["common"]["pages"])
+    font["pages"] = b3.read_entries()
+    notify_unexpected_line(listeners, 3, get_unexpected_line(file, source_file_type, b3, "page"))
+    
+    b4 = Block4Iterator(file, source_file_type, source_file_type)
+    font["chars"] = b4.read_entries()
+    notify_unexpected_line(listeners, 4, get_unexpected_line(file, source_file_type, b4, "char"))
+    for data in font["chars"]:
+        notify_listeners(listeners, "on_char", data)
+    
+    font["kernings"] = []
+    if block_5_exists(file, source_file_type):
+        b5 = Block5Iterator(file, source_file_type, source_file_type)
+        font["kernings"] = b5.read_entries()
+        notify_unexpected_line(listeners, 5, get_unexpected_line(file, source_file_type, b5, "kerning"))
+        for data in font["kernings"]:
+            notify_listeners(listeners, "on_kerning", data)
+    
+    notify_listeners(listeners, "on_end")
+    return font
+
+
+# Returns the line after the last entry a block iterator read if it's out of
+# place, or None. XML and JSON blocks end in a closing line, which the iterator
+# checks itself; text has none, so there, only another entry of the same kind
+# (keyword being the start of its line) counts.
+def get_unexpected_line(file, source_file_type, iterator, keyword):
+    if source_file_type == FILE_TYPE_TEXT:
+        pos = file.tell()
+        x = file.readline()
+        file.seek(pos)
+        return x if pattern(r'^' + keyword + r'\s').match(x) else None
+    return iterator.unexpected_line
+
+
+def notify_unexpected_line(listeners, block_type, x):
+    if x is not None:
+        notify_listeners(listeners, "on_unexpected_line", block_type, x)
+
+
+##########
+# Whole-file conversion
+##########
+
+# Converts an entire file, yielding the text or bytes of the new file one
+# fragment at a time (header and footer included). Nothing is written anywhere;
+# the caller decides where the fragments go.
+# Assumes the file has otherwise not been parsed yet.
+# If kerning_filter is given, it gets called with all kernings (as a list of
+# dictionaries) and the set of char ids in the font, and returns the list of
+# kernings to write instead.
+# If page_ranges (a list) is given, chars are grouped by page, and the page
+# range table gets appended to it. Text, XML, and JSON also store the table in
+# the file itself.
+# listeners is a list of objects that get to see the data as it's converted.
+# Each can have any of these methods, which get called with the dictionaries
+# of the blocks/entries that are written: on_info(data), on_common(data),
+# on_char(data), on_kerning(data); and on_end(), once everything's converted.
+# In binary, on_block(block_type, header, size) also gets called after each
+# block, with its 5-byte header as written and the number of bytes written
+# after the header.
+def convert_blocks(file, source_file_type, target_file_type, kerning_filter = None, page_ranges = None, listeners = ()):
+    yield get_file_header(target_file_type)
+    
+    block_listeners = get_listener_methods(listeners, "on_block") if target_file_type == FILE_TYPE_BINARY3 else []
+    
+    b1 = get_block_1_data(file, source_file_type)
+    notify_listeners(listeners, "on_info", b1)
+    yield from measure_block([encode_block_1_data(b1, target_file_type)], 1, block_listeners)
+    
+    b2 = get_block_2_data(file, source_file_type)
+    notify_listeners(listeners, "on_common", b2)
+    yield from measure_block([encode_block_2_data(b2, target_file_type)], 2, block_listeners)
+    
+    yield from measure_block(Block3Iterator(file, source_file_type, target_file_type, b2["pages"]), 3, block_listeners)
+    
+    b4 = Block4Iterator(file, source_file_type, target_file_type)
+    if page_ranges is not None:
+        entries = b4.read_entries()
+        page_ranges += group_chars_by_page(entries, b2["pages"])
+        b4 = Block4Iterator(None, source_file_type, target_file_type, entries)
+        b4.metadata["page_ranges"] = page_ranges
+    
+    char_ids = set()
+    if kerning_filter is not None:
+        b4.listeners.append(lambda data: char_ids.add(data["id"]))
+    b4.listeners += get_listener_methods(listeners, "on_char")
+    yield from measure_block(b4, 4, block_listeners)
+    
+    if block_5_exists(file, source_file_type):
+        b5 = Block5Iterator(file, source_file_type, target_file_type)
+        if kerning_filter is not None:
+            b5 = Block5Iterator(None, source_file_type, target_file_type, kerning_filter(b5.read_entries(), char_ids))
+        b5.listeners += get_listener_methods(listeners, "on_kerning")
+        yield from measure_block(b5, 5, block_listeners)
+    
+    notify_listeners(listeners, "on_end")
+    yield get_file_footer(target_file_type)
+
+
+# Returns the methods with the given name of every listener that has one.
+def get_listener_methods(listeners, name):
+    return [getattr(x, name) for x in listeners if hasattr(x, name)]
+
+
+def notify_listeners(listeners, name, *args):
+    for f in get_listener_methods(listeners, name):
+        f(*args)
+
+
+# Passes on the fragments of one binary block, then calls each of
+# block_listeners with the block's header and the size of what came after it.
+# Blocks that come out empty (no header at all) aren't reported.
+def measure_block(fragments, block_type, block_listeners):
+    if not block_listeners:
+        yield from fragments
+        return
+    
+    header = bytearray()
+    size = 0
+    for x in fragments:
+        if len(header) < 5:
+            header += x[:5 - len(header)]
+        size += len(x)
+        yield x
+    if size == 0:
+        return
+    for f in block_listeners:
+        f(block_type, bytes(header), size - len(header))
+
+
+# Joins a list of fragments returned by convert_blocks() into one str or bytes.
+def join_fragments(fragments, file_type):
+    if file_type == FILE_TYPE_BINARY3:
+        return bytes().join(fragments)
+    return "".join(fragments)
@@ -0,0 +1,260 @@
+import array
+import bisect
+import mmap
+import os
+import re
+import struct
+import sys
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+# Sidecar file layout (all little-endian):
+#   header: magic, version, source size, source mtime (ns), char count, kerning count
+#   u32 char ids[char count], sorted
+#   u64 char line offsets[char count]
+#   u32 kerning firsts[kerning count], sorted together with the seconds
+#   u32 kerning seconds[kerning count]
+#   u64 kerning line offsets[kerning count]
+INDEX_MAGIC = b'BMFI'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sIQQII")
+INDEX_EXTENSION = ".idx"
+
+# These only look at the start of each entry, so the scan stays cheap. The
+# same patterns work for both text and XML ("char id=65" / "<char id=\"65\"").
+CHAR_PATTERN = re.compile(rb'char\s+id="?(\d+)')
+KERNING_PATTERN = re.compile(rb'kerning\s+first="?(\d+)"?\s+second="?(\d+)')
+ATTRIBUTE_PATTERN = re.compile(r'(\w+)="?(-?\d+)"?')
+
+
+##########
+# Utility functions
+##########
+
+def get_index_filepath(filepath):
+    return filepath + INDEX_EXTENSION
+
+
+def new_u32_array(x = ()):
+    a = array.array("I", x)
+    assert a.itemsize == 4
+    return a
+
+
+def new_u64_array(x = ()):
+    a = array.array("Q", x)
+    assert a.itemsize == 8
+    return a
+
+
+# Parses the numeric attributes of a single char or kerning line (text or XML)
+# into a dictionary.
+def parse_entry_line(x):
+    data = {}
+    for key, value in ATTRIBUTE_PATTERN.findall(x):
+        data[key] = int(value)
+    return data
+
+
+##########
+# Index
+##########
+
+# Line offsets of every char and kerning entry in a text or XML file, sorted so
+# entries can be found with a binary search.
+class FontIndex:
+    # Scans the whole file once and records where each entry starts.
+    def build(self, data):
+        chars = []
+        for m in CHAR_PATTERN.finditer(data):
+            chars.append((int(m.group(1)), m.start()))
+        kernings = []
+        for m in KERNING_PATTERN.finditer(data):
+            kernings.append((int(m.group(1)), int(m.group(2)), m.start()))
+        
+        # BMFont writes both tables in order already, so this is usually a no-op
+        chars.sort()
+        kernings.sort()
+        
+        self.char_ids = new_u32_array(x[0] for x in chars)
+        self.char_offsets = new_u64_array(x[1] for x in chars)
+        self.kerning_firsts = new_u32_array(x[0] for x in kernings)
+        self.kerning_seconds = new_u32_array(x[1] for x in kernings)
+        self.kerning_offsets = new_u64_array(x[2] for x in kernings)
+    
+    
+    # Returns the line offset of the char with the given id, or -1.
+    def find_char(self, id):
+        i = bisect.bisect_left(self.char_ids, id)
+        if i < len(self.char_ids) and self.char_ids[i] == id:
+            return self.char_offsets[i]
+        return -1
+    
+    
+    # Returns the range of kerning entries whose first char is the given id.
+    def find_kernings(self, first):
+        start = bisect.bisect_left(self.kerning_firsts, first)
+        end = bisect.bisect_right(self.kerning_firsts, first, start)
+        return range(start, end)
+    
+    
+    # Returns the line offset of the kerning for the given pair, or -1.
+    def find_kerning(self, first, second):
+        r = self.find_kernings(first)
+        i = bisect.bisect_left(self.kerning_seconds, second, r.start, r.stop)
+        if i < r.stop and self.kerning_seconds[i] == second:
+            return self.kerning_offsets[i]
+        return -1
+    
+    
+    # Writes the index to a sidecar file. The source's size and modification
+    # time go in the header, so a stale sidecar can be detected later.
+    def save(self, filepath):
+        arrays = [self.char_ids, self.char_offsets, self.kerning_firsts, self.kerning_seconds, self.kerning_offsets]
+        file = open(filepath, "wb")
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.source_size, self.source_mtime, len(self.char_ids), len(self.kerning_firsts)))
+        for a in arrays:
+            if sys.byteorder == "big":
+                a = array.array(a.typecode, a)
+                a.byteswap()
+            a.tofile(file)
+        file.close()
+    
+    
+    # Reads an index from a sidecar file. Returns False (leaving the index
+    # untouched) if the sidecar is missing, damaged, or older than the source.
+    def load(self, filepath):
+        try:
+            file = open(filepath, "rb")
+        except OSError:
+            return False
+        
+        try:
+            header = file.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                return False
+            magic, version, source_size, source_mtime, char_count, kerning_count = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                return False
+            if source_size != self.source_size or source_mtime != self.source_mtime:
+                return False
+            
+            arrays = [new_u32_array(), new_u64_array(), new_u32_array(), new_u32_array(), new_u64_array()]
+            counts = [char_count, char_count, kerning_count, kerning_count, kerning_count]
+            for a, count in zip(arrays, counts):
+                a.fromfile(file, count)
+                if sys.byteorder == "big":
+                    a.byteswap()
+        except (EOFError, struct.error):
+            return False
+        finally:
+            file.close()
+        
+        self.char_ids, self.char_offsets, self.kerning_firsts, self.kerning_seconds, self.kerning_offsets = arrays
+        return True
+    
+    
+    def __init__(self, _source_stat):
+        self.source_size = _source_stat.st_size
+        self.source_mtime = _source_stat.st_mtime_ns
+        
+        self.char_ids = new_u32_array()
+        self.char_offsets = new_u64_array()
+        self.kerning_firsts = new_u32_array()
+        self.kerning_seconds = new_u32_array()
+        self.kerning_offsets = new_u64_array()
+
+
+##########
+# Lazy loader
+##########
+
+# Gives access to single chars and kernings of a text or XML font without
+# parsing the rest of the file. Only the lines a query touches get parsed.
+# The index is loaded from the sidecar file next to the font if it's up to
+# date; otherwise it's built (and, if save_index is set, written back).
+class LazyFont:
+    def read_line(self, offset):
+        end = self.data.find(b'\n', offset)
+        if end == -1:
+            end = len(self.data)
+        return self.data[offset:end].decode("utf-8")
+    
+    
+    # Returns block 1 (info) as a dictionary, in the same form bmfile uses.
+    def get_info(self):
+        file = open(self.filepath, "r")
+        data = bmfile.get_block_1_data(file, self.file_type)
+        file.close()
+        return data
+    
+    
+    # Returns block 2 (common) as a dictionary, in the same form bmfile uses.
+    def get_common(self):
+        file = open(self.filepath, "r")
+        bmfile.get_block_1_data(file, self.file_type)
+        data = bmfile.get_block_2_data(file, self.file_type)
+        file.close()
+        return data
+    
+    
+    # Returns the char with the given id as a dictionary, or None.
+    def get_char(self, id):
+        offset = self.index.find_char(id)
+        if offset == -1:
+            return None
+        return parse_entry_line(self.read_line(offset))
+    
+    
+    # Returns all kernings whose first char is the given id, as dictionaries.
+    def get_kernings(self, first):
+        return [parse_entry_line(self.read_line(self.index.kerning_offsets[i])) for i in self.index.find_kernings(first)]
+    
+    
+    # Returns the kerning amount for a pair of chars (0 if there's none).
+    def get_kerning(self, first, second):
+        offset = self.index.find_kerning(first, second)
+        if offset == -1:
+            return 0
+        return parse_entry_line(self.read_line(offset))["amount"]
+    
+    
+    def get_char_ids(self):
+        return self.index.char_ids
+    
+    
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    
+    def __init__(self, _filepath, _save_index = True):
+        self.filepath = _filepath
+        self.file_type = bmfile.check_file_format(self.filepath)
+        if self.file_type not in [bmfile.FILE_TYPE_TEXT, bmfile.FILE_TYPE_XML]:
+            raise ValueError("Lazy loading only works with text and XML .fnt files")
+        
+        self.file = open(self.filepath, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        
+        self.index = FontIndex(os.fstat(self.file.fileno()))
+        if not self.index.load(get_index_filepath(self.filepath)):
+            self.index.build(self.data)
+            if _save_index:
+                try:
+                    self.index.save(get_index_filepath(self.filepath))
+                except OSError:
+                    pass # read-only location; the index just won't be reused
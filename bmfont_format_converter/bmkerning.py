@@ -0,0 +1,252 @@
+import array
+import bisect
+import struct
+
+
+# Class file layout (all little-endian):
+#   header: magic, version, matrix layout, left class count, right class count, left entry count, right entry count
+#   u32 ids[left entry count], u16 classes[left entry count]
+#   u32 ids[right entry count], u16 classes[right entry count]
+#   MATRIX_DENSE: i16 amounts[left class count * right class count], row by row
+#   MATRIX_SPARSE: u32 cell count, u32 cells[cell count], i16 amounts[cell count],
+#                  where a cell is left class * right class count + right class,
+#                  sorted, and only class pairs with a non-zero amount are stored
+# Only chars that are in a class other than 0 have an entry.
+CLASSES_MAGIC = b'BMFK'
+CLASSES_VERSION = 2
+CLASSES_HEADER = struct.Struct("<4sIIHHII")
+CLASSES_EXTENSION = ".kern"
+
+MATRIX_DENSE = 0
+MATRIX_SPARSE = 1
+
+MAX_CLASS_COUNT = 0xFFFF
+
+
+##########
+# Dead pair removal
+##########
+
+# Removes kernings that can't have any effect:
+#  - duplicates of a pair that appeared earlier (the first one wins, like it
+#    does for any runtime that stops at the first match)
+#  - pairs with an amount of 0
+#  - pairs where either char isn't in the font
+# Returns the remaining kernings in their original order. If a stats
+# dictionary is given, the number of pairs removed for each reason is added to
+# its "duplicate", "zero", and "missing" keys.
+def remove_dead_kernings(kernings, char_ids, stats = None):
+    if stats is None:
+        stats = {}
+    for key in ["duplicate", "zero", "missing"]:
+        stats.setdefault(key, 0)
+    
+    seen = set()
+    kept = []
+    for data in kernings:
+        pair = (data["first"], data["second"])
+        if pair in seen:
+            stats["duplicate"] += 1
+            continue
+        seen.add(pair)
+        if data["amount"] == 0:
+            stats["zero"] += 1
+        elif data["first"] not in char_ids or data["second"] not in char_ids:
+            stats["missing"] += 1
+        else:
+            kept.append(data)
+    return kept
+
+
+##########
+# Class-based kerning
+##########
+
+# A compact, lossless form of a kerning table. Chars that kern identically on
+# the left side share a left class, chars that kern identically on the right
+# side share a right class, and amounts are stored once per class pair.
+# Looking up a pair is two array lookups plus one matrix lookup. Class 0 on
+# either side is for chars without any kerning.
+# When few chars share classes, most of the matrix is 0, so it's stored
+# sparsely instead (only the non-zero class pairs, found by binary search)
+# whenever that's smaller.
+class KerningClasses:
+    # Builds the classes from a list of kerning dictionaries. Pairs should be
+    # unique (see remove_dead_kernings()); for duplicates the first one wins.
+    def build(self, kernings):
+        rows = {}
+        for data in kernings:
+            rows.setdefault(data["first"], {}).setdefault(data["second"], data["amount"])
+        
+        # Left classes: chars whose whole row (every second and amount) matches
+        left_signatures = {}
+        left_of = {}
+        for first, row in rows.items():
+            signature = tuple(sorted(row.items()))
+            left_of[first] = left_signatures.setdefault(signature, len(left_signatures) + 1)
+        
+        # Right classes: chars whose whole column matches, where a column is
+        # described by left classes (chars in one left class share a row anyway)
+        columns = {}
+        for first, row in rows.items():
+            for second, amount in row.items():
+                columns.setdefault(second, set()).add((left_of[first], amount))
+        right_signatures = {}
+        right_of = {}
+        for second, column in columns.items():
+            signature = tuple(sorted(column))
+            right_of[second] = right_signatures.setdefault(signature, len(right_signatures) + 1)
+        
+        self.left_count = len(left_signatures) + 1
+        self.right_count = len(right_signatures) + 1
+        if self.left_count > MAX_CLASS_COUNT or self.right_count > MAX_CLASS_COUNT:
+            raise ValueError("Too many kerning classes ({0} left, {1} right)".format(self.left_count, self.right_count))
+        
+        cells = {}
+        for first, row in rows.items():
+            for second, amount in row.items():
+                if amount != 0:
+                    cells[left_of[first] * self.right_count + right_of[second]] = amount
+        self.set_matrix(cells)
+        self.set_class_maps(left_of, right_of)
+    
+    
+    # Stores the non-zero amounts ({cell: amount}) in whichever matrix layout
+    # is smaller.
+    def set_matrix(self, cells):
+        if 4 + 6 * len(cells) < 2 * self.left_count * self.right_count:
+            self.layout = MATRIX_SPARSE
+            self.cells = array.array("I", sorted(cells))
+            self.amounts = array.array("h", [cells[x] for x in self.cells])
+            self.matrix = None
+        else:
+            self.layout = MATRIX_DENSE
+            self.matrix = array.array("h", bytes(2 * self.left_count * self.right_count))
+            for x, amount in cells.items():
+                self.matrix[x] = amount
+            self.cells = None
+            self.amounts = None
+    
+    
+    # Returns the amount stored for a cell (left class * right count + right class).
+    def get_cell(self, x):
+        if self.layout == MATRIX_DENSE:
+            return self.matrix[x]
+        i = bisect.bisect_left(self.cells, x)
+        if i < len(self.cells) and self.cells[i] == x:
+            return self.amounts[i]
+        return 0
+    
+    
+    # Returns every non-zero cell as (left class, right class, amount).
+    def get_cells(self):
+        if self.layout == MATRIX_DENSE:
+            cells = [(x, amount) for x, amount in enumerate(self.matrix) if amount != 0]
+        else:
+            cells = zip(self.cells, self.amounts)
+        return [(x // self.right_count, x % self.right_count, amount) for x, amount in cells]
+    
+    
+    # Turns {id: class} dictionaries into arrays indexed directly by char id.
+    def set_class_maps(self, left_of, right_of):
+        size = max(list(left_of) + list(right_of) + [-1]) + 1
+        self.left_classes = array.array("H", bytes(2 * size))
+        self.right_classes = array.array("H", bytes(2 * size))
+        for id, c in left_of.items():
+            self.left_classes[id] = c
+        for id, c in right_of.items():
+            self.right_classes[id] = c
+    
+    
+    # Returns the kerning amount for a pair of chars (0 if there's none).
+    def get_amount(self, first, second):
+        if first >= len(self.left_classes) or second >= len(self.right_classes):
+            return 0
+        return self.get_cell(self.left_classes[first] * self.right_count + self.right_classes[second])
+    
+    
+    # Returns every non-zero pair as a list of kerning dictionaries again.
+    def get_kernings(self):
+        lefts = {}
+        rights = {}
+        for id, c in enumerate(self.left_classes):
+            if c != 0:
+                lefts.setdefault(c, []).append(id)
+        for id, c in enumerate(self.right_classes):
+            if c != 0:
+                rights.setdefault(c, []).append(id)
+        
+        kernings = []
+        for l, r, amount in self.get_cells():
+            for first in lefts.get(l, []):
+                for second in rights.get(r, []):
+                    kernings.append({"first": first, "second": second, "amount": amount})
+        kernings.sort(key = lambda data: (data["first"], data["second"]))
+        return kernings
+    
+    
+    # Returns the class file as bytes.
+    def encode(self):
+        left = [(id, c) for id, c in enumerate(self.left_classes) if c != 0]
+        right = [(id, c) for id, c in enumerate(self.right_classes) if c != 0]
+        
+        x = bytearray(CLASSES_HEADER.pack(CLASSES_MAGIC, CLASSES_VERSION, self.layout, self.left_count, self.right_count, len(left), len(right)))
+        for entries in [left, right]:
+            x += struct.pack("<{0}I".format(len(entries)), *[id for id, c in entries])
+            x += struct.pack("<{0}H".format(len(entries)), *[c for id, c in entries])
+        if self.layout == MATRIX_DENSE:
+            x += struct.pack("<{0}h".format(len(self.matrix)), *self.matrix)
+        else:
+            x += struct.pack("<I", len(self.cells))
+            x += struct.pack("<{0}I".format(len(self.cells)), *self.cells)
+            x += struct.pack("<{0}h".format(len(self.amounts)), *self.amounts)
+        return bytes(x)
+    
+    
+    def save(self, filepath):
+        file = open(filepath, "wb")
+        file.write(self.encode())
+        file.close()
+    
+    
+    def load(self, filepath):
+        file = open(filepath, "rb")
+        x = file.read()
+        file.close()
+        
+        magic, version, layout, self.left_count, self.right_count, left_size, right_size = CLASSES_HEADER.unpack_from(x, 0)
+        if magic != CLASSES_MAGIC or version != CLASSES_VERSION:
+            raise ValueError("Not a kerning class file")
+        pos = CLASSES_HEADER.size
+        
+        maps = []
+        for size in [left_size, right_size]:
+            ids = struct.unpack_from("<{0}I".format(size), x, pos)
+            pos += 4 * size
+            classes = struct.unpack_from("<{0}H".format(size), x, pos)
+            pos += 2 * size
+            maps.append(dict(zip(ids, classes)))
+        self.set_class_maps(maps[0], maps[1])
+        
+        if layout == MATRIX_DENSE:
+            self.layout = MATRIX_DENSE
+            self.matrix = array.array("h", struct.unpack_from("<{0}h".format(self.left_count * self.right_count), x, pos))
+        else:
+            self.layout = MATRIX_SPARSE
+            count = struct.unpack_from("<I", x, pos)[0]
+            self.cells = array.array("I", struct.unpack_from("<{0}I".format(count), x, pos + 4))
+            self.amounts = array.array("h", struct.unpack_from("<{0}h".format(count), x, pos + 4 + 4 * count))
+    
+    
+    def __init__(self, _kernings = None):
+        self.left_count = 1
+        self.right_count = 1
+        self.left_classes = array.array("H")
+        self.right_classes = array.array("H")
+        self.layout = MATRIX_DENSE
+        self.matrix = array.array("h", [0])
+        self.cells = None
+        self.amounts = None
+        
+        if _kernings is not None:
+            self.build(_kernings)
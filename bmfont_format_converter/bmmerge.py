@@ -0,0 +1,189 @@
+import os
+import sys
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+# Which font's char wins when several fonts have a char with the same id.
+PRIORITY_FIRST = "first" # the font listed first (e.g. Latin before a CJK fallback)
+PRIORITY_LAST = "last" # the font listed last (e.g. a patch font over a base font)
+
+# Pages are stored in a single byte in the binary format.
+MAX_PAGE_COUNT = 256
+
+# Common block fields that have to be the same in every font being merged,
+# since they describe the texture pages rather than the font.
+SHARED_COMMON_FIELDS = ["scaleW", "scaleH", "packed"]
+
+
+##########
+# Loading and saving
+##########
+
+# Reads a whole .fnt file (any format) into a dictionary with "info",
+# "common", "pages", "chars", and "kernings" keys (see bmfile.read_font()).
+def load_font(filepath):
+    file, source_format = bmfile.open_font(filepath)
+    font = bmfile.read_font(file, source_format)
+    file.close()
+    return font
+
+
+# Page file names are relative to the .fnt file's folder. Rewrites the names in
+# a font loaded from source_filepath so they're relative to the folder of
+# target_filepath instead, and still lead to the same files.
+def rebase_pages(font, source_filepath, target_filepath):
+    source_folder = os.path.dirname(os.path.abspath(source_filepath))
+    target_folder = os.path.dirname(os.path.abspath(target_filepath))
+    for data in font["pages"]:
+        x = os.path.join(source_folder, data["file"])
+        try:
+            x = os.path.relpath(x, target_folder)
+        except ValueError:
+            pass # on another drive, so it stays absolute
+        data["file"] = x.replace(os.sep, "/")
+
+
+# Writes a font dictionary (as returned by load_font() or merge_fonts()) to a
+# file in target_format.
+def save_font(font, filepath, target_format):
+    new_file = open(filepath, bmfile.get_write_mode(target_format))
+    new_file.write(bmfile.get_file_header(target_format))
+    new_file.write(bmfile.encode_block_1_data(font["info"], target_format))
+    new_file.write(bmfile.encode_block_2_data(font["common"], target_format))
+    for x in bmfile.Block3Iterator(None, bmfile.FILE_TYPE_INVALID, target_format, len(font["pages"]), font["pages"]):
+        new_file.write(x)
+    for x in bmfile.Block4Iterator(None, bmfile.FILE_TYPE_INVALID, target_format, font["chars"]):
+        new_file.write(x)
+    if font["kernings"]:
+        for x in bmfile.Block5Iterator(None, bmfile.FILE_TYPE_INVALID, target_format, font["kernings"]):
+            new_file.write(x)
+    new_file.write(bmfile.get_file_footer(target_format))
+    new_file.close()
+
+
+##########
+# Merging
+##########
+
+# Merges fonts into one, so a runtime needs one char table and one kerning
+# table instead of a chain of fallback fonts:
+#  - pages are put one after another, and each char's page is renumbered to
+#    match; two pages with the same file name can't both be kept, so that's
+#    an error
+#  - when several fonts have the same char id, the one from the font with the
+#    highest priority is kept (see PRIORITY_FIRST and PRIORITY_LAST)
+#  - kernings are kept for pairs where both chars were kept from the same
+#    font; a kerning from another font would be for a different glyph
+#  - the first font's info, lineHeight, and base are used, and every other
+#    font's chars get their yoffset moved so their baselines line up with it
+# The fonts' pages must all be the same size. If a stats dictionary is given,
+# the number of chars and kernings dropped because of collisions are added to
+# its "chars" and "kernings" keys.
+def merge_fonts(fonts, priority = PRIORITY_FIRST, stats = None):
+    if priority not in [PRIORITY_FIRST, PRIORITY_LAST]:
+        raise ValueError("Unknown priority {0}".format(priority))
+    if len(fonts) == 0:
+        raise ValueError("Nothing to merge")
+    if stats is None:
+        stats = {}
+    for key in ["chars", "kernings"]:
+        stats.setdefault(key, 0)
+    
+    base = fonts[0]
+    for font in fonts[1:]:
+        for key in SHARED_COMMON_FIELDS:
+            if font["common"][key] != base["common"][key]:
+                raise ValueError("Fonts with different {0} values ({1} and {2}) can't share pages".format(key, base["common"][key], font["common"][key]))
+    page_count = sum([len(font["pages"]) for font in fonts])
+    if page_count > MAX_PAGE_COUNT:
+        raise ValueError("Merged font would have {0} pages, but a font can only have {1}".format(page_count, MAX_PAGE_COUNT))
+    
+    # Page offsets and yoffset adjustments follow the order the fonts were given
+    pages = []
+    page_offsets = []
+    page_files = {}
+    for i in range(len(fonts)):
+        page_offsets.append(len(pages))
+        for data in fonts[i]["pages"]:
+            key = os.path.normcase(os.path.normpath(data["file"]))
+            if key in page_files:
+                raise ValueError("Font {0} and font {1} both have a page called {2}; rename one of them before merging".format(page_files[key] + 1, i + 1, data["file"]))
+            page_files[key] = i
+            pages.append({"id": len(pages), "file": data["file"]})
+    
+    order = list(range(len(fonts)))
+    if priority == PRIORITY_LAST:
+        order.reverse()
+    
+    chars = {}
+    owners = {}
+    for i in order:
+        shift = base["common"]["base"] - fonts[i]["common"]["base"]
+        for data in fonts[i]["chars"]:
+            if data["id"] in chars:
+                stats["chars"] += 1
+                continue
+            data = dict(data)
+            data["page"] += page_offsets[i]
+            data["yoffset"] += shift
+            chars[data["id"]] = data
+            owners[data["id"]] = i
+    
+    kernings = {}
+    for i in order:
+        for data in fonts[i]["kernings"]:
+            pair = (data["first"], data["second"])
+            if owners.get(data["first"]) != i or owners.get(data["second"]) != i or pair in kernings:
+                stats["kernings"] += 1
+                continue
+            kernings[pair] = dict(data)
+    
+    common = dict(base["common"])
+    common["pages"] = len(pages)
+    
+    merged = {}
+    merged["info"] = dict(base["info"])
+    merged["common"] = common
+    merged["pages"] = pages
+    merged["chars"] = [chars[id] for id in sorted(chars)]
+    merged["kernings"] = [kernings[pair] for pair in sorted(kernings)]
+    return merged
+
+
+# Merges .fnt files (any format) into a new file in target_format. Page file
+# names are rewritten to be relative to the new file's folder.
+def merge(filepaths, target_filepath, target_format, priority = PRIORITY_FIRST, stats = None):
+    fonts = []
+    for x in filepaths:
+        font = load_font(x)
+        rebase_pages(font, x, target_filepath)
+        fonts.append(font)
+    merged = merge_fonts(fonts, priority, stats)
+    save_font(merged, target_filepath, target_format)
+    return merged
+
+
+##########
+# Command line
+##########
+
+USAGE = """Usage:
+  python3 bmmerge.py <output> <t|x|b|j|jc> <fnt files...> [--priority-last]"""
+
+if __name__ == "__main__":
+    options = [x for x in sys.argv[1:] if x.startswith("--")]
+    args = [x for x in sys.argv[1:] if not x.startswith("--")]
+    
+    valid_inputs = ["t", "x", "b", "j", "jc"]
+    if len(args) >= 3 and args[1] in valid_inputs:
+        stats = {}
+        priority = PRIORITY_LAST if "--priority-last" in options else PRIORITY_FIRST
+        merged = merge(args[2:], args[0], valid_inputs.index(args[1]), priority, stats)
+        print("Merged {0} fonts into {1} ({2} chars, {3} kernings, {4} pages)".format(len(args) - 2, args[0], len(merged["chars"]), len(merged["kernings"]), len(merged["pages"])))
+        if stats["chars"] > 0 or stats["kernings"] > 0:
+            print("Dropped {0} chars and {1} kernings that were already in a font with higher priority".format(stats["chars"], stats["kernings"]))
+    else:
+        print(USAGE)
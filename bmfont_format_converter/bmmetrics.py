@@ -0,0 +1,115 @@
+import array
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+METRICS_EXTENSION = ".metrics.json"
+
+
+##########
+# Metrics
+##########
+
+# Collects summary metrics of a font, so consumers can size text boxes and pick
+# fallback fonts without going through the char table themselves.
+# It's a listener for bmfile.convert_blocks(), so the metrics come for free with
+# a conversion:
+#
+#   metrics = bmmetrics.FontMetrics()
+#   for x in bmfile.convert_blocks(file, source_format, target_format, listeners = [metrics]):
+#       new_file.write(x)
+#   metrics.save("example.fnt.metrics.json")
+class FontMetrics:
+    def on_common(self, data):
+        self.line_height = data["lineHeight"]
+        self.base = data["base"]
+    
+    
+    def on_char(self, data):
+        self.ids.append(data["id"])
+        
+        # Empty chars (e.g. space) don't cover anything vertically
+        if data["width"] > 0 and data["height"] > 0:
+            if self.min_top is None:
+                self.min_top = data["yoffset"]
+                self.max_bottom = data["yoffset"] + data["height"]
+            self.min_top = min(self.min_top, data["yoffset"])
+            self.max_bottom = max(self.max_bottom, data["yoffset"] + data["height"])
+            self.max_width = max(self.max_width, data["width"])
+            self.max_height = max(self.max_height, data["height"])
+        
+        self.xadvance_total += data["xadvance"]
+        self.max_xadvance = max(self.max_xadvance, data["xadvance"])
+        if data["xadvance"] > 0:
+            self.advances.add(data["xadvance"])
+    
+    
+    def on_kerning(self, data):
+        self.kerning_count += 1
+    
+    
+    # Returns the ids as a list of [first, last] ranges of consecutive ids.
+    def get_id_ranges(self):
+        ranges = []
+        for id in sorted(set(self.ids)):
+            if ranges and ranges[-1][1] == id - 1:
+                ranges[-1][1] = id
+            else:
+                ranges.append([id, id])
+        return ranges
+    
+    
+    # Returns the metrics as a dictionary. Ascent and descent are measured from
+    # the baseline, and are the furthest any char reaches above and below it.
+    def get_summary(self):
+        count = len(self.ids)
+        return {
+            "lineHeight": self.line_height,
+            "base": self.base,
+            "maxAscent": max(0, self.base - self.min_top) if self.min_top is not None else 0,
+            "maxDescent": max(0, self.max_bottom - self.base) if self.max_bottom is not None else 0,
+            "maxWidth": self.max_width,
+            "maxHeight": self.max_height,
+            "maxXAdvance": self.max_xadvance if count > 0 else 0,
+            "averageXAdvance": round(self.xadvance_total / count, 3) if count > 0 else 0,
+            # Zero-width chars (e.g. combining marks) don't count against this
+            "monospaced": len(self.advances) == 1,
+            "charCount": count,
+            "kerningCount": self.kerning_count,
+            "unicodeRanges": self.get_id_ranges(),
+        }
+    
+    
+    def save(self, filepath):
+        import json
+        file = open(filepath, "w")
+        json.dump(self.get_summary(), file, indent = 2)
+        file.write("\n")
+        file.close()
+    
+    
+    def __init__(self):
+        self.line_height = 0
+        self.base = 0
+        self.ids = array.array("I")
+        
+        self.min_top = None
+        self.max_bottom = None
+        self.max_width = 0
+        self.max_height = 0
+        
+        self.xadvance_total = 0
+        self.max_xadvance = -0x8000
+        self.advances = set()
+        self.kerning_count = 0
+
+
+# Reads a .fnt file (any format) and returns its metrics, without converting it.
+def measure_file(filepath):
+    metrics = FontMetrics()
+    file, source_format = bmfile.open_font(filepath)
+    bmfile.read_font(file, source_format, [metrics])
+    file.close()
+    return metrics
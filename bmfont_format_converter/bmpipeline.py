@@ -0,0 +1,245 @@
+import io
+import os
+import queue
+import threading
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+# Size of the raw chunks read from and written to disk.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# How many chunks each background thread may hold in its queue. Together with
+# the chunk size, this caps how much memory the pipeline uses.
+DEFAULT_QUEUE_DEPTH = 8
+
+
+##########
+# Prefetching reader
+##########
+
+# A read-only file-like object whose data is pulled from disk ahead of time by
+# a background thread. Supports just enough of the file API for bmfile's
+# parsers: read(), readline(), tell(), and seek().
+# In text mode, readline() returns str like a file opened with "r" would;
+# otherwise everything is bytes. Positions are always byte offsets.
+# Seeking backwards is possible to the position last returned by tell(), until
+# the next seek(), however far back it is; that's how the parsers look ahead
+# (tell(), read some lines, seek() back). Other than that, only the last chunk
+# or so is kept.
+class PrefetchReader:
+    # Runs on the background thread. Reads the file chunk by chunk into the
+    # queue, followed by None at the end of the file.
+    def read_worker(self):
+        try:
+            while not self.stopped.is_set():
+                x = self.raw_file.read(self.chunk_size)
+                if not self.put(x if x else None):
+                    return
+                if not x:
+                    return
+        except BaseException as e:
+            self.put(e)
+    
+    
+    # Puts an item on the queue, waiting while it's full. Returns False if the
+    # reader got closed in the meantime.
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    
+    # Appends the next chunk from the background thread to the buffer, dropping
+    # data that's too far behind the current position (or the last tell()) to
+    # be seeked back to. Returns False at the end of the file.
+    def fill(self):
+        if self.eof:
+            return False
+        
+        x = self.queue.get()
+        if isinstance(x, BaseException):
+            raise x
+        if x is None:
+            self.eof = True
+            return False
+        
+        oldest = self.pos if self.mark is None else min(self.mark, self.pos)
+        keep_from = min(max(0, oldest - self.buffer_start - self.chunk_size), len(self.buffer))
+        self.buffer = self.buffer[keep_from:] + x
+        self.buffer_start += keep_from
+        return True
+    
+    
+    def decode(self, x):
+        if self.binary:
+            return x
+        return x.decode("utf-8").replace("\r\n", "\n")
+    
+    
+    def read(self, size = -1):
+        if size is None or size < 0:
+            while self.fill():
+                pass
+            end = self.buffer_start + len(self.buffer)
+        else:
+            end = self.pos + size
+            while self.buffer_start + len(self.buffer) < end and self.fill():
+                pass
+        
+        x = self.buffer[self.pos - self.buffer_start:end - self.buffer_start]
+        self.pos += len(x)
+        return self.decode(x)
+    
+    
+    def readline(self):
+        search_from = self.pos
+        while True:
+            end = self.buffer.find(b'\n', search_from - self.buffer_start)
+            if end != -1:
+                end += self.buffer_start + 1
+                break
+            search_from = max(search_from, self.buffer_start + len(self.buffer))
+            if not self.fill():
+                end = self.buffer_start + len(self.buffer)
+                break
+        
+        x = self.buffer[self.pos - self.buffer_start:end - self.buffer_start]
+        self.pos += len(x)
+        return self.decode(x)
+    
+    
+    def tell(self):
+        self.mark = self.pos
+        return self.pos
+    
+    
+    def seek(self, offset, whence = io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("can only seek relative to the start or the current position")
+        if offset < self.buffer_start:
+            raise io.UnsupportedOperation("can't seek that far back in a prefetched file")
+        self.pos = offset
+        self.mark = None
+        return self.pos
+    
+    
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.raw_file.close()
+    
+    
+    def __init__(self, _filepath, _binary, _chunk_size = DEFAULT_CHUNK_SIZE, _queue_depth = DEFAULT_QUEUE_DEPTH):
+        self.binary = _binary
+        self.chunk_size = _chunk_size
+        self.raw_file = open(_filepath, "rb", buffering = 0)
+        
+        self.buffer = b''
+        self.buffer_start = 0 # file position of self.buffer[0]
+        self.pos = 0
+        self.mark = None # last position returned by tell(), kept until the next seek()
+        self.eof = False
+        
+        self.queue = queue.Queue(_queue_depth)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.read_worker, daemon = True)
+        self.thread.start()
+
+
+##########
+# Background writer
+##########
+
+# A write-only file-like object that collects writes into large chunks, and
+# hands them to a background thread that writes them to disk.
+# In text mode, write() takes str like a file opened with "w" would.
+# Errors from the background thread are raised by the next write() or close().
+class BackgroundWriter:
+    # Runs on the background thread. Writes chunks until it gets None.
+    def write_worker(self):
+        while True:
+            x = self.queue.get()
+            if x is None:
+                return
+            if self.error is not None:
+                continue # keep draining so write() never blocks forever
+            try:
+                self.raw_file.write(x)
+            except BaseException as e:
+                self.error = e
+    
+    
+    def check_error(self):
+        if self.error is not None:
+            raise self.error
+    
+    
+    def write(self, x):
+        self.check_error()
+        if not self.binary:
+            if os.linesep != "\n":
+                x = x.replace("\n", os.linesep)
+            x = x.encode("utf-8")
+        self.buffer += x
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+        return len(x)
+    
+    
+    # Hands whatever has been collected so far to the background thread.
+    def flush(self):
+        if self.buffer:
+            self.queue.put(bytes(self.buffer)) # blocks while the queue is full
+            self.buffer = bytearray()
+    
+    
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.raw_file.close()
+        self.check_error()
+    
+    
+    def __init__(self, _filepath, _binary, _chunk_size = DEFAULT_CHUNK_SIZE, _queue_depth = DEFAULT_QUEUE_DEPTH):
+        self.binary = _binary
+        self.chunk_size = _chunk_size
+        self.raw_file = open(_filepath, "wb", buffering = 0)
+        
+        self.buffer = bytearray()
+        self.error = None
+        
+        self.queue = queue.Queue(_queue_depth)
+        self.thread = threading.Thread(target = self.write_worker, daemon = True)
+        self.thread.start()
+
+
+##########
+# Pipelined conversion
+##########
+
+# Converts a file like main.py does, but with reading and writing done on
+# background threads. While the main thread parses and encodes, the reader is
+# already fetching the next chunks and the writer is flushing the previous ones,
+# which hides most of the I/O latency on slow (e.g. network) storage.
+# Any extra keyword arguments are passed on to bmfile.convert_blocks().
+def convert_pipelined(source_filepath, target_filepath, source_file_type, target_file_type, chunk_size = DEFAULT_CHUNK_SIZE, queue_depth = DEFAULT_QUEUE_DEPTH, **convert_options):
+    original_file = PrefetchReader(source_filepath, source_file_type == bmfile.FILE_TYPE_BINARY3, chunk_size, queue_depth)
+    try:
+        new_file = BackgroundWriter(target_filepath, target_file_type == bmfile.FILE_TYPE_BINARY3, chunk_size, queue_depth)
+        try:
+            for x in bmfile.convert_blocks(original_file, source_file_type, target_file_type, **convert_options):
+                new_file.write(x)
+        finally:
+            new_file.close()
+    finally:
+        original_file.close()
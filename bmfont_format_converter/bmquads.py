@@ -0,0 +1,235 @@
+import array
+import bisect
+import struct
+import sys
+try:
+    from . import bmfile
+except ImportError:
+    import bmfile
+
+
+# Quad buffer file layout (all little-endian):
+#   header: magic, version, layout, row count, offset of the rows, offset of the ids
+#   rows, one per char, sorted by id:
+#     LAYOUT_INTERLEAVED: one 40-byte vertex record per char (see ROW)
+#     LAYOUT_PLANAR: float32 positions[count * 4], float32 uvs[count * 4],
+#                    float32 xadvances[count], uint16 pages[count], uint16 chnls[count]
+#   u32 ids[row count]: the id of the char in each row, for finding rows
+# Every section starts on a 4-byte boundary, so it can be uploaded (or
+# viewed as a typed array) without copying.
+QUADS_MAGIC = b'BMFQ'
+QUADS_VERSION = 1
+QUADS_HEADER = struct.Struct("<4sIIIII")
+QUADS_EXTENSION = ".quads"
+
+LAYOUT_INTERLEAVED = 0
+LAYOUT_PLANAR = 1
+
+# Interleaved row: position x0, y0, x1, y1, uv u0, v0, u1, v1, xadvance, page, chnl.
+ROW = struct.Struct("<9f2H")
+
+# Positions are in pixels, relative to the pen position on the baseline, with
+# y pointing down (like BMFont itself): a char's top left corner is at
+# (xoffset, yoffset - base). UVs are normalized by scaleW and scaleH, with
+# (0, 0) at the top left of the page; renderers with v pointing up use 1 - v.
+CHAR_COLUMNS = ["id", "x", "y", "width", "height", "xoffset", "yoffset", "xadvance", "page", "chnl"]
+
+
+##########
+# Utility functions
+##########
+
+# NumPy is optional, and only imported the first time quads are encoded.
+# Returns None if it isn't installed.
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# Rounds an offset up to the next 4-byte boundary.
+def align(x):
+    return (x + 3) & ~3
+
+
+def to_little_endian(a):
+    if sys.byteorder == "big":
+        a = array.array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+##########
+# Building
+##########
+
+# Collects chars and turns them into a quad buffer that a renderer can upload
+# into a vertex buffer as is, so it doesn't have to work out positions and UVs
+# for every char itself. It's a listener for bmfile.convert_blocks():
+#
+#   quads = bmquads.QuadBuilder()
+#   for x in bmfile.convert_blocks(file, source_format, target_format, listeners = [quads]):
+#       new_file.write(x)
+#   quads.save("example.fnt.quads", bmquads.LAYOUT_PLANAR)
+class QuadBuilder:
+    def on_common(self, data):
+        self.scale_w = data["scaleW"]
+        self.scale_h = data["scaleH"]
+        self.base = data["base"]
+    
+    
+    def on_char(self, data):
+        for key in CHAR_COLUMNS:
+            self.columns[key].append(data[key])
+    
+    
+    # Returns the rows as parallel lists, sorted by id: ids, positions
+    # (4 per row), uvs (4 per row), xadvances, pages, chnls.
+    def get_rows(self):
+        c = self.columns
+        order = sorted(range(len(c["id"])), key = c["id"].__getitem__)
+        sw = float(self.scale_w or 1)
+        sh = float(self.scale_h or 1)
+        
+        positions = []
+        uvs = []
+        for i in order:
+            x0 = float(c["xoffset"][i])
+            y0 = float(c["yoffset"][i] - self.base)
+            positions += [x0, y0, x0 + c["width"][i], y0 + c["height"][i]]
+            uvs += [c["x"][i] / sw, c["y"][i] / sh, (c["x"][i] + c["width"][i]) / sw, (c["y"][i] + c["height"][i]) / sh]
+        return [[c["id"][i] for i in order], positions, uvs, [float(c["xadvance"][i]) for i in order], [c["page"][i] for i in order], [c["chnl"][i] for i in order]]
+    
+    
+    def encode_rows(self, layout):
+        ids, positions, uvs, xadvances, pages, chnls = self.get_rows()
+        if layout == LAYOUT_INTERLEAVED:
+            x = bytearray(ROW.size * len(ids))
+            for i in range(len(ids)):
+                ROW.pack_into(x, i * ROW.size, *positions[i * 4:i * 4 + 4], *uvs[i * 4:i * 4 + 4], xadvances[i], pages[i], chnls[i])
+            return ids, bytes(x)
+        x = bytearray()
+        for typecode, values in [("f", positions), ("f", uvs), ("f", xadvances), ("H", pages), ("H", chnls)]:
+            x += to_little_endian(array.array(typecode, values))
+        return ids, bytes(x)
+    
+    
+    # Same as encode_rows(), but does the math for all chars at once.
+    def encode_rows_numpy(self, numpy, layout):
+        c = {key: numpy.asarray(self.columns[key], dtype = numpy.float64) for key in CHAR_COLUMNS}
+        ids = numpy.asarray(self.columns["id"], dtype = numpy.uint32)
+        order = numpy.argsort(ids, kind = "stable")
+        c = {key: values[order] for key, values in c.items()}
+        sw = float(self.scale_w or 1)
+        sh = float(self.scale_h or 1)
+        
+        y0 = c["yoffset"] - self.base
+        positions = numpy.stack([c["xoffset"], y0, c["xoffset"] + c["width"], y0 + c["height"]], axis = 1).astype("<f4")
+        uvs = numpy.stack([c["x"] / sw, c["y"] / sh, (c["x"] + c["width"]) / sw, (c["y"] + c["height"]) / sh], axis = 1).astype("<f4")
+        xadvances = c["xadvance"].astype("<f4")
+        pages = c["page"].astype("<u2")
+        chnls = c["chnl"].astype("<u2")
+        
+        if layout == LAYOUT_INTERLEAVED:
+            rows = numpy.zeros(len(ids), dtype = [("position", "<f4", 4), ("uv", "<f4", 4), ("xadvance", "<f4"), ("page", "<u2"), ("chnl", "<u2")])
+            rows["position"] = positions
+            rows["uv"] = uvs
+            rows["xadvance"] = xadvances
+            rows["page"] = pages
+            rows["chnl"] = chnls
+            return ids[order].tolist(), rows.tobytes()
+        return ids[order].tolist(), bytes().join([x.tobytes() for x in [positions, uvs, xadvances, pages, chnls]])
+    
+    
+    # Returns the whole quad buffer file as bytes. NumPy is used if it's
+    # installed (and use_numpy isn't False); the output is the same either way.
+    def encode(self, layout = LAYOUT_INTERLEAVED, use_numpy = None):
+        if layout not in [LAYOUT_INTERLEAVED, LAYOUT_PLANAR]:
+            raise ValueError("Unknown layout {0}".format(layout))
+        numpy = load_numpy() if use_numpy is not False else None
+        if use_numpy and numpy is None:
+            raise ImportError("NumPy isn't installed")
+        
+        if numpy is not None:
+            ids, rows = self.encode_rows_numpy(numpy, layout)
+        else:
+            ids, rows = self.encode_rows(layout)
+        
+        rows_offset = QUADS_HEADER.size
+        ids_offset = align(rows_offset + len(rows))
+        x = bytearray(QUADS_HEADER.pack(QUADS_MAGIC, QUADS_VERSION, layout, len(ids), rows_offset, ids_offset))
+        x += rows
+        x += bytes(ids_offset - len(x))
+        x += to_little_endian(array.array("I", ids))
+        return bytes(x)
+    
+    
+    def save(self, filepath, layout = LAYOUT_INTERLEAVED, use_numpy = None):
+        file = open(filepath, "wb")
+        file.write(self.encode(layout, use_numpy))
+        file.close()
+    
+    
+    def __len__(self):
+        return len(self.columns["id"])
+    
+    
+    def __init__(self):
+        self.scale_w = 0
+        self.scale_h = 0
+        self.base = 0
+        self.columns = {key: [] for key in CHAR_COLUMNS}
+
+
+# Builds the quad buffer for a .fnt file (any format) and saves it, without
+# converting the font.
+def export_file(filepath, target_filepath, layout = LAYOUT_INTERLEAVED, use_numpy = None):
+    quads = QuadBuilder()
+    file, source_format = bmfile.open_font(filepath)
+    bmfile.read_font(file, source_format, [quads])
+    file.close()
+    quads.save(target_filepath, layout, use_numpy)
+    return quads
+
+
+##########
+# Loading
+##########
+
+# A quad buffer read back in, for tools (a renderer would upload the rows
+# directly). Finds a char's row with a binary search over the ids.
+class QuadBuffer:
+    # Returns the row of the char with the given id, or -1.
+    def find_row(self, id):
+        i = bisect.bisect_left(self.ids, id)
+        if i < len(self.ids) and self.ids[i] == id:
+            return i
+        return -1
+    
+    
+    # Returns a char's row as (x0, y0, x1, y1, u0, v0, u1, v1, xadvance, page,
+    # chnl), or None if there's no such char.
+    def get_quad(self, id):
+        i = self.find_row(id)
+        if i == -1:
+            return None
+        if self.layout == LAYOUT_INTERLEAVED:
+            return ROW.unpack_from(self.data, self.rows_offset + i * ROW.size)
+        n = self.count
+        pos = self.rows_offset
+        position = struct.unpack_from("<4f", self.data, pos + i * 16)
+        uv = struct.unpack_from("<4f", self.data, pos + n * 16 + i * 16)
+        xadvance = struct.unpack_from("<f", self.data, pos + n * 32 + i * 4)
+        page = struct.unpack_from("<H", self.data, pos + n * 36 + i * 2)
+        chnl = struct.unpack_from("<H", self.data, pos + n * 38 + i * 2)
+        return position + uv + xadvance + page + chnl
+    
+    
+    def __init__(self, _data):
+        magic, version, self.layout, self.count, self.rows_offset, ids_offset = QUADS_HEADER.unpack_from(_data, 0)
+        if magic != QUADS_MAGIC or version != QUADS_VERSION:
+            raise ValueError("Not a quad buffer")
+        self.data = _data
+        self.ids = struct.unpack_from("<{0}I".format(self.count), _data, ids_offset)
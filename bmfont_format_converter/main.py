@@ -1,39 +1,68 @@
 import sys
 import os
 import time
-import bmfile
 
+try:
+    from . import bmcheck
+    from . import bmfile
+    from . import bmkerning
+    from . import bmmetrics
+    from . import bmpipeline
+    from . import bmquads
+except ImportError:
+    import bmcheck
+    import bmfile
+    import bmkerning
+    import bmmetrics
+    import bmpipeline
+    import bmquads
 
-filepath = None
-source_format = bmfile.FILE_TYPE_INVALID
-target_format = bmfile.FILE_TYPE_INVALID
 
+##########
+# Check files (no conversion)
+##########
 
-if __name__ != "__main__":
-    quit()
+# With --check, every positional argument is a file to check, and nothing
+# gets converted. Returns 1 if any file has problems, 0 otherwise.
+def check_files(args, options):
+    failed = 0
+    for x in args:
+        validator = bmcheck.check_file(x)
+        if validator.is_valid():
+            if "--quiet" not in options:
+                print("{0}: OK".format(x))
+            continue
+        failed += 1
+        print("{0}: {1} problem(s)".format(x, validator.issue_count))
+        for issue in validator.issues:
+            print("  " + issue)
+        if validator.issue_count > len(validator.issues):
+            print("  ...")
+    print("Checked {0} files, {1} with problems".format(len(args), failed))
+    return 1 if failed > 0 else 0
 
 
 ##########
 # Request filepath
 ##########
 
-valid_filepath = False
-
-if len(sys.argv) >= 2:
-    filepath = sys.argv[1]
-    source_format = bmfile.check_file_format(filepath)
-    if source_format != bmfile.FILE_TYPE_INVALID:
-        valid_filepath = True
-
-while valid_filepath == False:
-    filepath = input("Enter the file path to a BMFont .fnt file:\n")
-    if filepath == "":
-        print("Nothing entered, quitting")
-        quit()
-    source_format = bmfile.check_file_format(filepath)
-    if source_format != bmfile.FILE_TYPE_INVALID:
-        valid_filepath = True
-    else:
+# Returns the filepath and source format, asking for a filepath if the
+# command line didn't have a valid one. Returns None if nothing was entered.
+def request_filepath(args):
+    if len(args) >= 1:
+        filepath = args[0]
+        source_format = bmfile.check_file_format(filepath)
+        if source_format != bmfile.FILE_TYPE_INVALID:
+            return filepath, source_format
+    
+    while True:
+        filepath = input("Enter the file path to a BMFont .fnt file:\n")
+        if filepath == "":
+            print("Nothing entered, quitting")
+            return None
+        source_format = bmfile.check_file_format(filepath)
+        if source_format != bmfile.FILE_TYPE_INVALID:
+            return filepath, source_format
         print("File path does not lead to a valid BMFont .fnt file")
 
 
@@ -41,30 +70,31 @@ while valid_filepath == False:
 # Request target format
 ##########
 
-valid_target_format = False
-
-# Parses t, x, b into 0, 1, 2 respectively.
+# Parses t, x, b, j, jc into 0, 1, 2, 3, 4 respectively.
 def target_format_parse(x):
-    valid_inputs = ["t", "x", "b"]
+    valid_inputs = ["t", "x", "b", "j", "jc"]
     for i in range(len(valid_inputs)):
         if x == valid_inputs[i]:
             return i
     return bmfile.FILE_TYPE_INVALID
 
-if len(sys.argv) >= 3:
-    target_format = target_format_parse(sys.argv[2])
-    if target_format != bmfile.FILE_TYPE_INVALID:
-        valid_target_format = True
-
-while valid_target_format == False:
-    target_format_string = input("Enter the desired output format (t for text, x for XML, b for binary):\n")
-    if target_format_string == "":
-        print("Nothing entered, quitting")
-        quit()
-    target_format = target_format_parse(target_format_string)
-    if target_format != bmfile.FILE_TYPE_INVALID:
-        valid_target_format = True
-    else:
+
+# Returns the target format, asking for one if the command line didn't have a
+# valid one. Returns None if nothing was entered.
+def request_target_format(args):
+    if len(args) >= 2:
+        target_format = target_format_parse(args[1])
+        if target_format != bmfile.FILE_TYPE_INVALID:
+            return target_format
+    
+    while True:
+        target_format_string = input("Enter the desired output format (t for text, x for XML, b for binary, j for JSON, jc for columnar JSON):\n")
+        if target_format_string == "":
+            print("Nothing entered, quitting")
+            return None
+        target_format = target_format_parse(target_format_string)
+        if target_format != bmfile.FILE_TYPE_INVALID:
+            return target_format
         print("Invalid selection for output format")
 
 
@@ -72,49 +102,146 @@ while valid_target_format == False:
 # Convert from source to target format
 ##########
 
-t1 = time.time()
-print("Converting...")
-
-os.rename(filepath, filepath + ".old")
-original_file = None
-new_file = None
-
-if source_format == bmfile.FILE_TYPE_BINARY3:
-    original_file = open(filepath + ".old", "rb")
-else:
-    original_file = open(filepath + ".old", "r")
-
-if target_format == bmfile.FILE_TYPE_BINARY3:
-    new_file = open(filepath, "wb")
-else:
-    new_file = open(filepath, "w")
-
-new_file.write(bmfile.get_file_header(target_format))
-
-b1 = bmfile.get_block_1_data(original_file, source_format)
-new_file.write(bmfile.encode_block_1_data(b1, target_format))
-
-b2 = bmfile.get_block_2_data(original_file, source_format)
-new_file.write(bmfile.encode_block_2_data(b2, target_format))
-
-b3 = bmfile.Block3Iterator(original_file, source_format, target_format, b2["pages"])
-for i in b3:
-    new_file.write(i)
-
-b4 = bmfile.Block4Iterator(original_file, source_format, target_format)
-for i in b4:
-    new_file.write(i)
-
-if bmfile.block_5_exists(original_file, source_format):
-    b5 = bmfile.Block5Iterator(original_file, source_format, target_format)
-    for i in b5:
-        new_file.write(i)
+# Returns the exit status: 1 if --validate found the source's blocks broken
+# (nothing gets converted then), 0 otherwise.
+def convert(filepath, source_format, target_format, options):
+    t1 = time.time()
+    
+    # The fused validator only sees what the readers make of the records, and
+    # binary records that don't line up with their blocks can't be read at all,
+    # so the source's block headers are checked before anything is touched.
+    if "--validate" in options and source_format == bmfile.FILE_TYPE_BINARY3:
+        original_file = open(filepath, "rb")
+        issues = bmcheck.check_binary_blocks(original_file)
+        original_file.close()
+        if issues:
+            print("Not converted, {0} has {1} problem(s):".format(filepath, len(issues)))
+            for issue in issues:
+                print("  " + issue)
+            return 1
+    
+    print("Converting...")
+    
+    os.rename(filepath, filepath + ".old")
+    
+    convert_options = {}
+    
+    kerning_stats = {}
+    classes_stats = {}
+    if "--compact-kernings" in options or "--kerning-classes" in options:
+        def kerning_filter(kernings, char_ids):
+            if "--kerning-classes" in options:
+                # The class file is only worth keeping if it's smaller than the
+                # pairs themselves (as binary kerning records)
+                live_kernings = bmkerning.remove_dead_kernings(kernings, char_ids)
+                x = bmkerning.KerningClasses(live_kernings).encode()
+                classes_stats["size"] = len(x)
+                classes_stats["pairs_size"] = len(live_kernings) * bmfile.Block5Iterator.BLOCK_5_BINARY3_ENTRY_SIZE
+                if classes_stats["size"] < classes_stats["pairs_size"]:
+                    file = open(filepath + bmkerning.CLASSES_EXTENSION, "wb")
+                    file.write(x)
+                    file.close()
+            if "--compact-kernings" in options:
+                kernings = bmkerning.remove_dead_kernings(kernings, char_ids, kerning_stats)
+            return kernings
+        convert_options["kerning_filter"] = kerning_filter
+    
+    page_ranges = None
+    if "--group-pages" in options:
+        page_ranges = []
+        convert_options["page_ranges"] = page_ranges
+    
+    validator = None
+    if "--validate" in options:
+        validator = bmcheck.FontValidator()
+        convert_options.setdefault("listeners", []).append(validator)
+    
+    metrics = None
+    if "--metrics" in options:
+        metrics = bmmetrics.FontMetrics()
+        convert_options.setdefault("listeners", []).append(metrics)
+    
+    quads = None
+    if "--quads" in options or "--quads-planar" in options:
+        quads = bmquads.QuadBuilder()
+        convert_options.setdefault("listeners", []).append(quads)
+    
+    if "--pipelined" in options:
+        bmpipeline.convert_pipelined(filepath + ".old", filepath, source_format, target_format, **convert_options)
+    else:
+        original_file = open(filepath + ".old", bmfile.get_read_mode(source_format))
+        new_file = open(filepath, bmfile.get_write_mode(target_format))
+        
+        for i in bmfile.convert_blocks(original_file, source_format, target_format, **convert_options):
+            new_file.write(i)
+        
+        original_file.close()
+        new_file.close()
+    
+    if page_ranges is not None and target_format == bmfile.FILE_TYPE_BINARY3:
+        bmfile.save_page_ranges(filepath + bmfile.PAGE_RANGES_EXTENSION, page_ranges)
+    if metrics is not None:
+        metrics.save(filepath + bmmetrics.METRICS_EXTENSION)
+    if quads is not None:
+        quads.save(filepath + bmquads.QUADS_EXTENSION, bmquads.LAYOUT_PLANAR if "--quads-planar" in options else bmquads.LAYOUT_INTERLEAVED)
+    
+    t2 = time.time()
+    print("Conversion complete (took {0} seconds)".format(t2 - t1))
+    print("Old file saved as {0}".format(filepath + ".old"))
+    if kerning_stats:
+        print("Removed {0} duplicate, {1} zero, and {2} orphaned kerning pairs".format(kerning_stats["duplicate"], kerning_stats["zero"], kerning_stats["missing"]))
+    if page_ranges is not None and target_format == bmfile.FILE_TYPE_BINARY3:
+        print("Page ranges saved as {0}".format(filepath + bmfile.PAGE_RANGES_EXTENSION))
+    if "--kerning-classes" in options:
+        if not classes_stats:
+            print("No kernings, so no kerning classes were saved")
+        elif classes_stats["size"] < classes_stats["pairs_size"]:
+            print("Kerning classes saved as {0} ({1} bytes, down from {2} bytes of pairs)".format(filepath + bmkerning.CLASSES_EXTENSION, classes_stats["size"], classes_stats["pairs_size"]))
+        else:
+            print("Kerning classes not saved: they'd take {0} bytes, but the pairs only take {1}".format(classes_stats["size"], classes_stats["pairs_size"]))
+    if metrics is not None:
+        print("Metrics saved as {0}".format(filepath + bmmetrics.METRICS_EXTENSION))
+    if quads is not None:
+        print("Quad buffer saved as {0}".format(filepath + bmquads.QUADS_EXTENSION))
+    if validator is not None:
+        if validator.is_valid():
+            print("No problems found")
+        else:
+            print("Found {0} problem(s):".format(validator.issue_count))
+            for issue in validator.issues:
+                print("  " + issue)
+    return 0
 
-new_file.write(bmfile.get_file_footer(target_format))
 
-original_file.close()
-new_file.close()
+##########
+# Entry point
+##########
 
-t2 = time.time()
-print("Conversion complete (took {0} seconds)".format(t2 - t1))
-print("Old file saved as {0}".format(filepath + ".old"))
+# Runs the converter with the given command line arguments (sys.argv[1:] by
+# default). Returns the exit status.
+def main(argv = None):
+    if argv is None:
+        argv = sys.argv[1:]
+    
+    # Options (arguments starting with "--") may go anywhere on the command line.
+    # Everything else is a positional argument.
+    options = [x for x in argv if x.startswith("--")]
+    args = [x for x in argv if not x.startswith("--")]
+    
+    if "--check" in options:
+        return check_files(args, options)
+    
+    source = request_filepath(args)
+    if source is None:
+        return 0
+    filepath, source_format = source
+    
+    target_format = request_target_format(args)
+    if target_format is None:
+        return 0
+    
+    return convert(filepath, source_format, target_format, options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())